@@ -5,45 +5,63 @@ from langchain_community.llms import Ollama
 from langchain.chains.router.llm_router import LLMRouterChain, RouterOutputParser
 from langchain.chains.router.multi_prompt_prompt import MULTI_PROMPT_ROUTER_TEMPLATE
 from langchain.chains import RetrievalQA
+import copy
 import os
+import threading
+import time
 
-# Import from the new package
-try:
-    from langchain_chroma import Chroma
-except ImportError:
-    # Fallback for old version
-    from langchain_community.vectorstores import Chroma
+from embeddings import embeddings_for_index
+from index_store import IndexWatcher, current_index_directory
+from reranker import Reranker, RerankingRetriever, get_scorer
+from single_flight import SingleFlight, normalize_query
+from model_residency import ModelResidencyManager
+from traffic_capture import StageTimingCallback
+from dedup import document_sources
+from tenants import ALL_TENANTS, PartitionedRetriever, normalize_tenant, open_partitions, tenant_search_scopes
 
-# Import embeddings
-try:
-    from langchain_ollama import OllamaEmbeddings
-except ImportError:
-    # Fallback for old version
-    from langchain_community.embeddings import OllamaEmbeddings
+# Every agent prompt (and the router prompt) starts with this identical static text and keeps all
+# variable content (documents, profile, query) at the end, so Ollama can reuse
+# the KV cache of the shared prefix instead of re-evaluating it per request.
+SHARED_PROMPT_PREFIX = """You are AIDE, an AI assistant for young professionals. You help with company onboarding, learning and career development. Be accurate, friendly and professional, and never invent company facts.
+
+"""
+
+AGENT_NAMES = {
+    "onboarding": "🎯 Company Document Assistant",
+    "learning": "📚 Learning Companion",
+    "career_coach": "🚀 Career Coach"
+}
 
 class AIDEAgents:
     def __init__(self):
+        # Keep llama3 resident between requests and track load / prompt-eval costs
+        self.residency = ModelResidencyManager(base_url="http://localhost:11434", model="llama3")
+        
         # Initialize the LLM for all agents
-        self.llm = Ollama(base_url="http://localhost:11434", model="llama3")
+        if os.getenv("AIDE_STUB_LLM"):
+            # Canned answers for traffic replay and load tests: retrieval still runs for real
+            from langchain_community.llms.fake import FakeListLLM
+            self.llm = FakeListLLM(responses=["(stub answer)"])
+        else:
+            self.llm = Ollama(base_url="http://localhost:11434", model="llama3", **self.residency.llm_kwargs())
+            self.residency.start()
         
-        # Initialize vector database for RAG with company data
-        try:
-            embeddings = OllamaEmbeddings(model="llama3", base_url="http://localhost:11434")
-            self.vector_db = Chroma(
-                persist_directory="./chroma_db_company",
-                embedding_function=embeddings
+        # Over-fetch cheaply from the ANN search, then re-rank down to a few precise chunks
+        self.rerank_mode = os.getenv("AIDE_RERANKER", "cross-encoder")
+        self.reranker = None
+        if self.rerank_mode != "none":
+            self.reranker = Reranker(
+                get_scorer(self.rerank_mode),
+                time_budget_ms=float(os.getenv("AIDE_RERANK_BUDGET_MS", "250"))
             )
-        except Exception as e:
-            print(f"Error initializing vector database: {e}")
-            raise
         
-        # Configure retriever - FIXED: Remove unsupported score_threshold parameter
-        self.retriever = self.vector_db.as_retriever(
-            search_kwargs={
-                "k": 5  # Only keep the k parameter
-                # "score_threshold": 0.7  # REMOVED: This parameter is not supported
-            }
-        )
+        # Coalesce identical in-flight queries; joiners wait at most this long before computing alone
+        self.flights = SingleFlight(join_timeout=float(os.getenv("AIDE_SINGLE_FLIGHT_JOIN_TIMEOUT", "60")))
+        
+        # Initialize vector database for RAG with company data
+        self.index_watcher = IndexWatcher()
+        self._swap_lock = threading.Lock()
+        self.retrievers = self._build_retrievers(current_index_directory())
         
         # Initialize agents
         self._setup_onboarding_agent()
@@ -51,30 +69,100 @@ class AIDEAgents:
         self._setup_coach_agent()
         self._setup_concierge_agent()
     
+    def _build_retrievers(self, persist_directory):
+        """Open an index version and build one retriever per tenant search scope"""
+        try:
+            # Query embeddings must come from the model the index was built with
+            embeddings = embeddings_for_index(persist_directory)
+            vector_dbs = open_partitions(persist_directory, embeddings)
+        except Exception as e:
+            print(f"Error initializing vector database: {e}")
+            raise
+        
+        fetch_k = 5 if self.reranker is None else 30
+        
+        quantized_index = None
+        if os.getenv("AIDE_RETRIEVER") == "quantized":
+            # Compact int8 index stored inside this version; None falls back to Chroma
+            from quantized_index import QuantizedRetriever, load_version_index
+            quantized_index = load_version_index(persist_directory)
+        
+        # A tenant searches its own partition plus the shared one; ALL_TENANTS searches everything
+        retrievers = {}
+        for tenant, partitions in tenant_search_scopes(list(vector_dbs)).items():
+            if quantized_index is not None:
+                # One compact index holds every partition and is filtered by tenant per scope
+                retriever = QuantizedRetriever(
+                    index=quantized_index,
+                    embeddings=embeddings,
+                    k=fetch_k,
+                    tenants=partitions if tenant != ALL_TENANTS else None
+                )
+            else:
+                retriever = PartitionedRetriever(
+                    vector_dbs={name: vector_dbs[name] for name in partitions},
+                    embeddings=embeddings,
+                    k=fetch_k
+                )
+            if self.reranker is not None:
+                retriever = RerankingRetriever(base_retriever=retriever, reranker=self.reranker, top_n=3)
+            retrievers[tenant] = retriever
+        return retrievers
+    
+    def _check_index_version(self):
+        """Start a background swap if a new index version has been published"""
+        # A version published while another swap runs is reported again on a later poll
+        pointer = self.index_watcher.poll()
+        if pointer and self._swap_lock.acquire(blocking=False):
+            threading.Thread(target=self._swap_index, args=(pointer,), daemon=True).start()
+    
+    def _swap_index(self, pointer):
+        """Build retriever and onboarding chain for a new index version, then switch to them"""
+        try:
+            retrievers = self._build_retrievers(pointer["path"])
+            onboarding_agents = self._build_onboarding_agents(retrievers)
+            # Plain attribute rebinding: in-flight queries keep using the objects they already hold
+            self.retrievers, self.onboarding_agents = retrievers, onboarding_agents
+            self.index_watcher.mark_loaded(pointer["version"])
+            print(f"Switched to company index version {pointer['version']}")
+        except Exception as e:
+            # The watcher still reports this version, so the swap is retried on a later poll
+            print(f"Error switching to index {pointer['path']}: {e}")
+        finally:
+            self._swap_lock.release()
+    
     def _setup_onboarding_agent(self):
         """Setup onboarding assistant agent"""
-        onboarding_prompt_template = """You are a professional onboarding assistant specialized in answering questions about company policies, procedures, and related information.
+        self.onboarding_agents = self._build_onboarding_agents(self.retrievers)
+    
+    def _build_onboarding_agents(self, retrievers):
+        """One onboarding chain per tenant search scope"""
+        return {tenant: self._build_onboarding_agent(retriever) for tenant, retriever in retrievers.items()}
+    
+    def _build_onboarding_agent(self, retriever):
+        """Build the onboarding RetrievalQA chain over a retriever"""
+        onboarding_prompt_template = SHARED_PROMPT_PREFIX + """You are a professional onboarding assistant specialized in answering questions about company policies, procedures, and related information.
 
-Please answer strictly based on the following company document content. If the information is not available in the documents, please state so honestly.
+Please answer strictly based on the company document content below. If the information is not available in the documents, please state so honestly.
+Please provide accurate, detailed answers and cite information sources when possible. Maintain professionalism and accuracy in your responses.
 
 Relevant document content:
 {context}
 
 Question: {question}
 
-Please provide accurate, detailed answers and cite information sources when possible. Maintain professionalism and accuracy in your responses.
-
 Professional response:"""
         
         onboarding_prompt = PromptTemplate(
             template=onboarding_prompt_template,
             input_variables=["context", "question"]
         )
+        self.onboarding_prompt = onboarding_prompt
         
-        self.onboarding_agent = RetrievalQA.from_chain_type(
+        return RetrievalQA.from_chain_type(
             llm=self.llm,
             chain_type="stuff",
-            retriever=self.retriever,
+            retriever=retriever,
             chain_type_kwargs={"prompt": onboarding_prompt},
             return_source_documents=True
         )
@@ -82,32 +170,32 @@ Professional response:"""
     def _setup_learning_agent(self):
         """Setup learning companion agent"""
         learning_prompt = PromptTemplate(
-            template="""You are a helpful and inspiring learning companion for young professionals.
+            template=SHARED_PROMPT_PREFIX + """You are a helpful and inspiring learning companion for young professionals.
 Your goal is to suggest relevant learning resources, courses, books, or internal workshops based on the user's role and interests.
+Provide friendly, motivating responses with 2-3 concrete suggestions. You can recommend based on training resources found in company documents.
 
 Role: {role}
 Interests: {interests}
 Query: {query}
 
-Provide friendly, motivating responses with 2-3 concrete suggestions. You can recommend based on training resources found in company documents.
-
 Learning Companion:""",
             input_variables=["role", "interests", "query"]
         )
+        self.learning_prompt = learning_prompt
         self.learning_agent = LLMChain(llm=self.llm, prompt=learning_prompt, output_key="text")
     
     def _setup_coach_agent(self):
         """Setup career coach agent"""
         coach_prompt = PromptTemplate(
-            template="""You are an experienced career coach. Your role is to provide guidance on goal setting, skill development for career advancement, and navigating company culture.
+            template=SHARED_PROMPT_PREFIX + """You are an experienced career coach. Your role is to provide guidance on goal setting, skill development for career advancement, and navigating company culture.
+Provide thoughtful, actionable advice. Ask clarifying questions if the query is vague. You can reference relevant career development paths from company policies.
 
 Query: {query}
 
-Provide thoughtful, actionable advice. Ask clarifying questions if the query is vague. You can reference relevant career development paths from company policies.
-
 Career Coach:""",
             input_variables=["query"]
         )
+        self.coach_prompt = coach_prompt
         self.coach_agent = LLMChain(llm=self.llm, prompt=coach_prompt, output_key="text")
     
     def _setup_concierge_agent(self):
@@ -129,7 +217,9 @@ Career Coach:""",
         
         destinations_str = "\n".join([f"{d['name']}: {d['description']}" for d in destinations])
         
-        router_template = MULTI_PROMPT_ROUTER_TEMPLATE.format(destinations=destinations_str)
+        # The router runs right before every agent call; sharing the prefix keeps it
+        # from evicting the agents' cached prefix when Ollama has a single KV slot
+        router_template = SHARED_PROMPT_PREFIX + MULTI_PROMPT_ROUTER_TEMPLATE.format(destinations=destinations_str)
         router_prompt = PromptTemplate(
             template=router_template,
             input_variables=["input"],
@@ -137,36 +227,129 @@ Career Coach:""",
         )
         self.concierge_agent = LLMRouterChain.from_llm(self.llm, router_prompt)
     
-    def process_query(self, user_query, user_data):
-        """Process user query"""
+    def process_query(self, user_query, user_data, trace=None, route=None):
+        """Process user query
+        
+        Pass a dict as `trace` to receive the route, retrieved chunk ids and per-stage
+        timings; `route` skips the router and forces a destination (used by replay).
+        """
+        self._check_index_version()
+        
+        # Identical concurrent queries share one routing call and one answer generation
+        start = time.perf_counter()
+        next_step = route or self.route_query(user_query)
+        route_ms = (time.perf_counter() - start) * 1000
+        
+        response_data = self.answer_query(next_step, user_query, user_data, trace)
+        if trace is not None:
+            trace["route"] = next_step
+            trace.setdefault("timings_ms", {})["route"] = route_ms
+        return response_data
+    
+    def route_query(self, user_query):
+        """Route a query, sharing the routing call with identical in-flight queries"""
+        return self.flights.do(("route", normalize_query(user_query)), lambda: self._route_query(user_query))
+    
+    def answer_query(self, next_step, user_query, user_data, trace=None):
+        """Answer a routed query, sharing generation with identical in-flight queries"""
+        computed = []
+        
+        def compute():
+            computed.append(True)
+            return self._answer_query(next_step, user_query, user_data)
+        
+        answer_key = ("answer", normalize_query(user_query), next_step, self._profile_key(next_step, user_data))
+        # Waiters share the leader's result; hand each caller its own copy
+        response_data = copy.deepcopy(self.flights.do(answer_key, compute))
+        stage_trace = response_data.pop("trace", {})
+        if trace is not None:
+            trace.update(stage_trace)
+            trace["coalesced"] = not computed
+        return response_data
+    
+    def retrieve_batch(self, user_queries, tenant=""):
+        """Retrieve onboarding documents for many queries with one batched embedding call"""
+        retrievers = self.retrievers
+        base_retriever = retrievers[self._tenant_scope({"tenant": tenant}, retrievers)]
+        if isinstance(base_retriever, RerankingRetriever):
+            base_retriever = base_retriever.base_retriever
+        
+        vectors = base_retriever.embeddings.embed_documents(user_queries)
+        fetch_k = 5 if self.reranker is None else 30
+        results = []
+        for user_query, vector in zip(user_queries, vectors):
+            docs = base_retriever.search_by_vector(vector, fetch_k)
+            if self.reranker is not None:
+                docs = self.reranker.rerank(user_query, docs, 3)
+            results.append(docs)
+        return results
+    
+    def answer_from_documents(self, user_query, docs):
+        """Answer an onboarding query from already retrieved documents"""
+        response_data = {
+            "answer": "",
+            "agent_name": AGENT_NAMES["onboarding"],
+            "sources": document_sources(docs)
+        }
+        try:
+            # Same context layout as the "stuff" chain used by process_query
+            context = "\n\n".join(doc.page_content for doc in docs)
+            response_data["answer"] = self.llm.invoke(self.onboarding_prompt.format(context=context, question=user_query))
+        except Exception as e:
+            print(f"Onboarding agent error: {e}")
+            response_data["answer"] = "I encountered an error while searching our documents. Please try again or ask a different question."
+            response_data["error"] = str(e)
+        return response_data
+    
+    def _route_query(self, user_query):
+        """Pick the destination agent for a query"""
         try:
             route = self.concierge_agent.invoke(user_query)
-            next_step = route["destination"].lower()
+            return route["destination"].lower()
         except Exception as e:
             print(f"Routing error: {e}")
-            next_step = "onboarding"  # Default route to onboarding assistant
-        
+            return "onboarding"  # Default route to onboarding assistant
+    
+    def _tenant_scope(self, user_data, scopes):
+        """The tenant search scope of a user; unknown or missing tenants search all partitions"""
+        tenant = normalize_tenant(user_data.get('tenant', ''))
+        return tenant if tenant in scopes else ALL_TENANTS
+    
+    def _profile_key(self, next_step, user_data):
+        """The parts of the user profile that can change the answer on a given route"""
+        if next_step == "learning":
+            return (user_data.get('role', ''), user_data.get('interests', ''))
+        if next_step == "onboarding":
+            return (self._tenant_scope(user_data, self.retrievers),)
+        return ()
+    
+    def _answer_query(self, next_step, user_query, user_data):
+        """Generate the answer on the chosen route"""
         response_data = {
             "answer": "",
             "agent_name": "",
             "sources": []
         }
+        # Stage timings and retrieved chunks, moved out of the response by answer_query
+        timing = StageTimingCallback()
+        config = {"callbacks": [timing]}
         
         if next_step == "onboarding":
             try:
-                result = self.onboarding_agent.invoke({"query": user_query})
+                onboarding_agents = self.onboarding_agents
+                onboarding_agent = onboarding_agents[self._tenant_scope(user_data, onboarding_agents)]
+                result = onboarding_agent.invoke({"query": user_query}, config=config)
                 response_data["answer"] = result['result']
                 response_data["agent_name"] = "🎯 Company Document Assistant"
                 # Extract source document information
-                if hasattr(result, 'source_documents') and result['source_documents']:
-                    response_data["sources"] = [
-                        doc.metadata.get('filename', 'Unknown file') 
-                        for doc in result['source_documents']
-                    ]
+                if result.get('source_documents'):
+                    response_data["sources"] = document_sources(result['source_documents'])
             except Exception as e:
                 print(f"Onboarding agent error: {e}")
                 response_data["answer"] = "I encountered an error while searching our documents. Please try again or ask a different question."
                 response_data["agent_name"] = "🎯 Company Document Assistant"
+                # Canned answers are for chat users; batch jobs must not record them as finished
+                response_data["error"] = str(e)
         
         elif next_step == "learning":
             try:
@@ -174,29 +357,88 @@ Career Coach:""",
                     "role": user_data.get('role', ''),
                     "interests": user_data.get('interests', ''),
                     "query": user_query
-                })
+                }, config=config)
                 response_data["answer"] = response['text']
                 response_data["agent_name"] = "📚 Learning Companion"
             except Exception as e:
                 print(f"Learning agent error: {e}")
                 response_data["answer"] = "I had trouble processing your learning request. Please try again."
                 response_data["agent_name"] = "📚 Learning Companion"
+                response_data["error"] = str(e)
         
         elif next_step == "career_coach":
             try:
-                response = self.coach_agent.invoke({"query": user_query})
+                response = self.coach_agent.invoke({"query": user_query}, config=config)
                 response_data["answer"] = response['text']
                 response_data["agent_name"] = "🚀 Career Coach"
             except Exception as e:
                 print(f"Career coach error: {e}")
                 response_data["answer"] = "I encountered an issue with career guidance. Please try again."
                 response_data["agent_name"] = "🚀 Career Coach"
+                response_data["error"] = str(e)
         
         else:
             response_data["answer"] = "I'm not sure how to answer this question. Please try rephrasing your question or specify whether you need help with onboarding, learning, or career development."
             response_data["agent_name"] = "🤖 Assistant"
         
+        response_data["trace"] = {
+            "timings_ms": timing.timings_ms,
+            "chunk_ids": timing.chunk_ids,
+            "rerank_fallback": timing.rerank_fallback
+        }
         return response_data
+    
+    def process_query_stream(self, user_query, user_data):
+        """Process user query, returning an iterator of answer events as they are generated"""
+        self._check_index_version()
+        
+        next_step = self.route_query(user_query)
+        # Identical concurrent queries share one generation and receive the same token stream
+        stream_key = ("stream", normalize_query(user_query), next_step, self._profile_key(next_step, user_data))
+        return self.flights.do_stream(stream_key, lambda: self._answer_stream(next_step, user_query, user_data))
+    
+    def _stream_tokens(self, prompt):
+        for text in self.llm.stream(prompt):
+            yield {"type": "token", "text": text}
+    
+    def _answer_stream(self, next_step, user_query, user_data):
+        """Generate the answer on the chosen route as meta, sources, token and done events"""
+        yield {"type": "meta", "route": next_step, "agent_name": AGENT_NAMES.get(next_step, "🤖 Assistant")}
+        
+        if next_step == "onboarding":
+            try:
+                retrievers = self.retrievers
+                docs = retrievers[self._tenant_scope(user_data, retrievers)].invoke(user_query)
+                yield {"type": "sources", "sources": document_sources(docs)}
+                # Same context layout as the "stuff" chain used by process_query
+                context = "\n\n".join(doc.page_content for doc in docs)
+                yield from self._stream_tokens(self.onboarding_prompt.format(context=context, question=user_query))
+            except Exception as e:
+                print(f"Onboarding agent error: {e}")
+                yield {"type": "token", "text": "I encountered an error while searching our documents. Please try again or ask a different question."}
+        
+        elif next_step == "learning":
+            try:
+                yield from self._stream_tokens(self.learning_prompt.format(
+                    role=user_data.get('role', ''),
+                    interests=user_data.get('interests', ''),
+                    query=user_query
+                ))
+            except Exception as e:
+                print(f"Learning agent error: {e}")
+                yield {"type": "token", "text": "I had trouble processing your learning request. Please try again."}
+        
+        elif next_step == "career_coach":
+            try:
+                yield from self._stream_tokens(self.coach_prompt.format(query=user_query))
+            except Exception as e:
+                print(f"Career coach error: {e}")
+                yield {"type": "token", "text": "I encountered an issue with career guidance. Please try again."}
+        
+        else:
+            yield {"type": "token", "text": "I'm not sure how to answer this question. Please try rephrasing your question or specify whether you need help with onboarding, learning, or career development."}
+        
+        yield {"type": "done"}
 
 # Global instance
 agents_system = AIDEAgents()
\ No newline at end of file
@@ -1,25 +1,118 @@
 # api_gateway.py
-from fastapi import FastAPI, HTTPException
+import json
+import time
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List
 from agents import agents_system
+from batch_answer import iter_batch_answers, normalize_item
+from traffic_capture import capture_from_env
+from profiling import profiler_from_env
 
 app = FastAPI(title="AIDE API Gateway")
 
+# Opt-in traffic capture for replay (set AIDE_CAPTURE_DIR)
+traffic_capture = capture_from_env()
+
+# Per-request profiling (X-AIDE-Profile: 1) plus sampling of the slowest requests
+request_profiler = profiler_from_env()
+
 class ChatRequest(BaseModel):
     message: str
     user_id: str
     role: str = ""
     interests: str = ""
+    tenant: str = ""  # company partition to search, e.g. "nvidia"; empty searches all
+
+class BatchItem(BaseModel):
+    id: str = ""
+    message: str
+    role: str = ""
+    interests: str = ""
+    tenant: str = ""
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchItem]
+    max_workers: int = 4
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(
+    request: ChatRequest,
+    x_aide_trace: str = Header(default=""),
+    x_aide_route: str = Header(default=""),
+    x_aide_profile: str = Header(default="")
+):
+    """Answer one message; X-AIDE-Trace: 1 adds route, chunk ids and stage timings,
+    X-AIDE-Route forces a destination agent (used by replay_traffic.py),
+    X-AIDE-Profile: 1 profiles the request and returns the profile file paths"""
+    trace = {}
+    start = time.perf_counter()
+    status = 200
     try:
-        user_data = {"role": request.role, "interests": request.interests}
-        response_data = agents_system.process_query(request.message, user_data)
+        user_data = {"role": request.role, "interests": request.interests, "tenant": request.tenant}
+        # Run the blocking agent call off the event loop so concurrent requests overlap
+        # (and identical ones can be coalesced by the agents' single-flight layer)
+        process_args = (request.message, user_data, trace, x_aide_route or None)
+        if x_aide_profile == "1" or request_profiler.should_sample():
+            response_data, profile = await run_in_threadpool(
+                request_profiler.run, "chat", agents_system.process_query, *process_args,
+                sampled=x_aide_profile != "1"
+            )
+            if x_aide_profile == "1":
+                response_data["profile"] = profile["files"] if profile else []
+        else:
+            response_data = await run_in_threadpool(agents_system.process_query, *process_args)
+        if x_aide_trace == "1":
+            response_data["trace"] = trace
         return response_data
     except Exception as e:
+        status = 500
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if traffic_capture is not None:
+            traffic_capture.record(request.dict(), trace, (time.perf_counter() - start) * 1000, status)
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Stream answer events (meta, sources, token, done) as newline-delimited JSON"""
+    try:
+        user_data = {"role": request.role, "interests": request.interests, "tenant": request.tenant}
+        events = await run_in_threadpool(agents_system.process_query_stream, request.message, user_data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    def ndjson():
+        try:
+            for event in events:
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+    
+    # Starlette iterates sync generators in its threadpool, so tokens flow without blocking the loop
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(request: BatchChatRequest):
+    """Answer many questions; results stream back as newline-delimited JSON in completion order"""
+    items = [normalize_item(item.dict(exclude_unset=True), index) for index, item in enumerate(request.items, start=1)]
+    max_workers = max(1, min(request.max_workers, 8))
+    
+    def ndjson():
+        for result in iter_batch_answers(items, agents_system, max_workers):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "AIDE API Gateway"}
\ No newline at end of file
+    return {"status": "healthy", "service": "AIDE API Gateway"}
+
+@app.get("/stats")
+async def stats():
+    return {
+        "single_flight": agents_system.flights.stats,
+        "ollama": agents_system.residency.metrics(),
+        "profiling": request_profiler.stats
+    }
\ No newline at end of file
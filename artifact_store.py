@@ -0,0 +1,189 @@
+# artifact_store.py
+"""Cache of parsed document artifacts, so re-chunking never re-parses sources.
+
+Parsing (PyPDF2/pdfplumber/python-docx/python-pptx/openpyxl) is the slowest
+CPU stage of ingestion. The extracted per-page/per-slide/per-row units are
+stored here, keyed by the SHA-256 of the file content and the parser name and
+version, as gzip-compressed JSON lines: one header line, then one line per
+unit. Units hold text and unit-level metadata only; source path and filename
+are re-attached on load, so renamed or copied files still hit the cache.
+iter_or_parse streams: units are written as the parser yields them and read
+back lazily, so a large file never sits in memory whole.
+
+Usage:
+    python artifact_store.py list
+    python artifact_store.py stats
+    python artifact_store.py prune [--data-dir ./company_data]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+ARTIFACT_DIRECTORY = "./.artifact_cache"
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_content_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    def __init__(self, directory: str = ARTIFACT_DIRECTORY):
+        self.directory = directory
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _path(self, content_hash: str, parser: str, parser_version: int) -> str:
+        return os.path.join(self.directory, f"{content_hash}-{parser}-v{parser_version}.jsonl.gz")
+
+    def load(self, content_hash: str, parser: str, parser_version: int) -> Optional[List[Dict]]:
+        path = self._path(content_hash, parser, parser_version)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                next(f)  # header
+                return [json.loads(line) for line in f]
+        except (OSError, ValueError, StopIteration) as e:
+            print(f"Ignoring unreadable artifact {path}: {e}")
+            return None
+
+    def _iter_units(self, path: str) -> Iterator[Dict]:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            next(f)  # header
+            for line in f:
+                yield json.loads(line)
+
+    def save(self, content_hash: str, parser: str, parser_version: int, source: str, units: Iterable[Dict]):
+        """Write units as they are produced; a parser error leaves no artifact behind"""
+        os.makedirs(self.directory, exist_ok=True)
+        header = {
+            "source": source,
+            "content_hash": content_hash,
+            "parser": parser,
+            "parser_version": parser_version,
+            "created": time.time(),
+        }
+        # The header comes first, so the count of streamed units is not known when it is written
+        if isinstance(units, list):
+            header["units"] = len(units)
+        path = self._path(content_hash, parser, parser_version)
+        temp_path = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+        try:
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                f.write(json.dumps(header) + "\n")
+                for unit in units:
+                    f.write(json.dumps(unit, ensure_ascii=False) + "\n")
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def get_or_parse(self, file_path: str, parser: str, parser_version: int,
+                     parse_fn: Callable[[str], List[Dict]]) -> List[Dict]:
+        """Return cached units for this exact file content, parsing and storing them on a miss"""
+        content_hash = file_content_hash(file_path)
+        units = self.load(content_hash, parser, parser_version)
+        if units is not None:
+            self.stats["hits"] += 1
+            return units
+
+        self.stats["misses"] += 1
+        units = parse_fn(file_path)
+        self.save(content_hash, parser, parser_version, file_path, units)
+        return units
+
+    def iter_or_parse(self, file_path: str, parser: str, parser_version: int,
+                      parse_fn: Callable[[str], Iterable[Dict]]) -> Iterator[Dict]:
+        """Like get_or_parse, but parsed units are written as they are yielded and read back lazily
+
+        Parsing completes before this returns, so parser errors are raised here.
+        """
+        content_hash = file_content_hash(file_path)
+        path = self._path(content_hash, parser, parser_version)
+        if os.path.exists(path):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    json.loads(f.readline())
+                self.stats["hits"] += 1
+                return self._iter_units(path)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable artifact {path}: {e}")
+
+        self.stats["misses"] += 1
+        self.save(content_hash, parser, parser_version, file_path, parse_fn(file_path))
+        return self._iter_units(path)
+
+    def entries(self) -> List[Dict]:
+        """Header of every stored artifact, with its path and compressed size"""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".jsonl.gz"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    header = json.loads(f.readline())
+            except (OSError, ValueError) as e:
+                header = {"error": str(e)}
+            header["path"] = path
+            header["bytes"] = os.path.getsize(path)
+            entries.append(header)
+        return entries
+
+    def prune(self, parser_versions: Dict[str, int], data_directory: Optional[str] = None) -> List[str]:
+        """Delete artifacts from outdated parser versions, and (given a data directory) of content no longer present"""
+        live_hashes = None
+        if data_directory is not None:
+            live_hashes = set()
+            for root, _, files in os.walk(data_directory):
+                for file in files:
+                    live_hashes.add(file_content_hash(os.path.join(root, file)))
+
+        removed = []
+        for entry in self.entries():
+            stale = (
+                "error" in entry
+                or parser_versions.get(entry["parser"]) != entry["parser_version"]
+                or (live_hashes is not None and entry["content_hash"] not in live_hashes)
+            )
+            if stale:
+                os.remove(entry["path"])
+                removed.append(entry["path"])
+        return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and prune the parsed-document artifact cache")
+    parser.add_argument("command", choices=["list", "stats", "prune"])
+    parser.add_argument("--directory", default=ARTIFACT_DIRECTORY)
+    parser.add_argument("--data-dir", help="Also prune artifacts whose content is no longer in this directory")
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.directory)
+    if args.command == "list":
+        for entry in store.entries():
+            if "error" in entry:
+                print(f"{entry['path']}: unreadable ({entry['error']})")
+                continue
+            print(f"{entry['content_hash'][:12]}  {entry['parser']:<6} v{entry['parser_version']}  "
+                  f"{entry.get('units', '?')!s:>5} units  {entry['bytes'] / 1024:8.1f} KB  {entry['source']}")
+    elif args.command == "stats":
+        entries = store.entries()
+        total_bytes = sum(entry["bytes"] for entry in entries)
+        print(f"{len(entries)} artifacts, {total_bytes / 1e6:.2f} MB in {args.directory}")
+    else:
+        from patched_document_processor import PARSER_VERSIONS
+        removed = store.prune(PARSER_VERSIONS, args.data_dir)
+        print(f"🧹 Removed {len(removed)} stale artifacts")
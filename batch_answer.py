@@ -0,0 +1,148 @@
+# batch_answer.py
+"""Bulk answering of question lists (FAQ packs, expected cohort questions).
+
+Input is JSONL, one question per line:
+    {"id": "faq-1", "message": "How long is probation?", "role": "", "interests": "", "tenant": "nvidia"}
+("question" is accepted instead of "message"; a missing id defaults to the
+line number.) All questions are routed first, onboarding questions are
+embedded in one batched call, and generation runs with bounded parallelism,
+grouped by route. Results are appended to the output JSONL as each one
+completes, so an interrupted job resumes by skipping ids already written.
+Failed answers are written with an "error" field and retried on resume.
+
+Usage:
+    python batch_answer.py questions.jsonl answers.jsonl --workers 4
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List
+
+
+def normalize_item(item: Dict, line_number: int) -> Dict:
+    return {
+        "id": str(item.get("id", line_number)),
+        "message": item.get("message") or item.get("question", ""),
+        "role": item.get("role", ""),
+        "interests": item.get("interests", ""),
+        "tenant": item.get("tenant", ""),
+    }
+
+
+def read_items(path: str) -> List[Dict]:
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if line:
+                items.append(normalize_item(json.loads(line), line_number))
+    return items
+
+
+def completed_ids(path: str) -> set:
+    """Ids answered successfully in an output file; failed entries and a truncated last line are ignored"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if "id" in result and not result.get("error"):
+                done.add(result["id"])
+    return done
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, 'rb') as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def iter_batch_answers(items: List[Dict], agents, max_workers: int = 4) -> Iterator[Dict]:
+    """Yield one result per item, in completion order"""
+    if not items:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        routes = list(pool.map(lambda item: agents.route_query(item["message"]), items))
+
+    by_route = defaultdict(list)
+    for item, route in zip(items, routes):
+        by_route[route].append(item)
+
+    onboarding_by_tenant = defaultdict(list)
+    for item in by_route.pop("onboarding", []):
+        onboarding_by_tenant[item["tenant"]].append(item)
+    # One embedding call per tenant partition instead of one per question
+    onboarding_items, onboarding_docs = [], []
+    for tenant, group in onboarding_by_tenant.items():
+        onboarding_items.extend(group)
+        onboarding_docs.extend(agents.retrieve_batch([item["message"] for item in group], tenant))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        # Submitting route by route keeps same-prompt generations adjacent, which
+        # helps Ollama reuse the cached prompt prefix
+        for item, docs in zip(onboarding_items, onboarding_docs):
+            future = pool.submit(agents.answer_from_documents, item["message"], docs)
+            futures[future] = (item, "onboarding")
+        for route, group in by_route.items():
+            for item in group:
+                user_data = {"role": item["role"], "interests": item["interests"], "tenant": item["tenant"]}
+                future = pool.submit(agents.answer_query, route, item["message"], user_data)
+                futures[future] = (item, route)
+
+        try:
+            for future in as_completed(futures):
+                item, route = futures[future]
+                try:
+                    response_data = future.result()
+                except Exception as e:
+                    print(f"Batch answer error for {item['id']}: {e}")
+                    response_data = {"answer": "", "agent_name": "", "sources": [], "error": str(e)}
+                yield {"id": item["id"], "message": item["message"], "route": route, **response_data}
+        except GeneratorExit:
+            # The consumer went away (e.g. a /chat/batch client disconnected): don't
+            # let the pool's shutdown run every queued generation anyway
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def run_batch_job(input_path: str, output_path: str, max_workers: int = 4):
+    from agents import agents_system
+
+    items = read_items(input_path)
+    done = completed_ids(output_path)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} questions, {len(done)} already answered, {len(pending)} to go")
+
+    start = time.perf_counter()
+    with open(output_path, 'a', encoding='utf-8') as out:
+        # Terminate a line cut off by an interrupted run before appending
+        if not _ends_with_newline(output_path):
+            out.write("\n")
+        for count, result in enumerate(iter_batch_answers(pending, agents_system, max_workers), start=1):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            status = f"failed: {result['error']}" if result.get("error") else result['route']
+            print(f"  [{count}/{len(pending)}] {result['id']} ({status})")
+
+    print(f"✅ Batch completed in {time.perf_counter() - start:.1f}s, results in {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL list of questions in bulk")
+    parser.add_argument("input", help="Input JSONL with one question per line")
+    parser.add_argument("output", help="Output JSONL; existing ids are skipped (resume)")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum concurrent generations")
+    args = parser.parse_args()
+    run_batch_job(args.input, args.output, args.workers)
@@ -0,0 +1,145 @@
+# dedup.py
+"""Near-duplicate chunk elimination with MinHash and LSH.
+
+Overlapping corporate documents, repeated boilerplate pages, the splitter's
+overlap and the dual PyPDF2/pdfplumber extraction all produce chunks that are
+near-identical. Each chunk is reduced to a MinHash signature over word
+shingles; LSH banding finds candidate pairs without comparing every pair, and
+candidates whose estimated Jaccard similarity reaches the threshold are
+collapsed into one chunk. The surviving chunk keeps references to every
+source it stands for, down to the page, slide or rows (e.g. policy.pdf#p12),
+so nothing is lost from the source citations.
+"""
+import os
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_WORD_PATTERN = re.compile(r"\w+")
+# Unit location appended to a reference by _source_reference
+_LOCATION_PATTERN = re.compile(r"#(?:p\d+|slide\d+|r\d+|sheet:.*)$")
+
+
+def _shingles(text: str, size: int) -> set:
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _source_reference(metadata: Dict) -> str:
+    """File name plus the unit location within it: file.pdf#p12, deck.pptx#slide3, data.csv#r51, book.xlsx#sheet:HR!r2"""
+    reference = metadata.get("filename") or os.path.basename(metadata.get("source", "unknown"))
+    if metadata.get("page") is not None:
+        return f"{reference}#p{metadata['page']}"
+    if metadata.get("slide") is not None:
+        return f"{reference}#slide{metadata['slide']}"
+    if metadata.get("sheet") is not None:
+        rows = f"!r{metadata['row_start']}" if metadata.get("row_start") is not None else ""
+        return f"{reference}#sheet:{metadata['sheet']}{rows}"
+    if metadata.get("row_start") is not None:
+        return f"{reference}#r{metadata['row_start']}"
+    return reference
+
+
+def document_sources(docs: List) -> List[str]:
+    """Source files of retrieved documents, including the sources of collapsed duplicates"""
+    sources = []
+    for doc in docs:
+        duplicate_sources = doc.metadata.get("duplicate_sources")
+        references = duplicate_sources.split("; ") if duplicate_sources else [doc.metadata.get("filename", "Unknown file")]
+        # Locations are kept in the metadata; citations show file names only
+        for reference in references:
+            filename = _LOCATION_PATTERN.sub("", reference)
+            if filename not in sources:
+                sources.append(filename)
+    return sources
+
+
+class MinHashDeduplicator:
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in _shingles(text, self.shingle_size)),
+            dtype=np.uint64
+        )
+        # (a * x + b) mod p for every permutation and shingle; a, x < 2^32 cannot overflow uint64
+        permuted = (np.outer(hashes, self._a) + self._b) % np.uint64(_MERSENNE_PRIME)
+        return permuted.min(axis=0)
+
+    def clusters(self, texts: List[str]) -> List[List[int]]:
+        """Group indexes of near-duplicate texts; singletons are returned as one-element groups"""
+        signatures = np.array([self.signature(text) for text in texts]) if texts else np.empty((0, self.num_perm))
+        parent = list(range(len(texts)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(self.bands):
+            buckets = {}
+            band_rows = signatures[:, band * self.rows:(band + 1) * self.rows]
+            for i, row in enumerate(band_rows):
+                buckets.setdefault(row.tobytes(), []).append(i)
+            for members in buckets.values():
+                first = members[0]
+                for other in members[1:]:
+                    root_first, root_other = find(first), find(other)
+                    if root_first == root_other:
+                        continue
+                    # LSH only proposes candidates; confirm with the estimated Jaccard similarity
+                    if np.mean(signatures[first] == signatures[other]) >= self.threshold:
+                        parent[root_other] = root_first
+
+        groups = {}
+        for i in range(len(texts)):
+            groups.setdefault(find(i), []).append(i)
+        return list(groups.values())
+
+    def deduplicate(self, documents: List) -> Tuple[List, Dict]:
+        """Collapse near-duplicate documents, returning the kept documents and a report"""
+        groups = self.clusters([doc.page_content for doc in documents])
+        kept, removed_chars = [], 0
+
+        for members in sorted(groups, key=min):
+            # Keep the longest text of each group, it carries the most content
+            keeper = max(members, key=lambda i: len(documents[i].page_content))
+            document = documents[keeper]
+            if len(members) > 1:
+                references = []
+                for i in sorted(members):
+                    reference = _source_reference(documents[i].metadata)
+                    if reference not in references:
+                        references.append(reference)
+                # Vector store metadata must be scalar, so references are joined into one string
+                document.metadata["duplicate_sources"] = "; ".join(references)
+                document.metadata["duplicate_count"] = len(members)
+                removed_chars += sum(len(documents[i].page_content) for i in members if i != keeper)
+            kept.append(document)
+
+        total_chars = sum(len(doc.page_content) for doc in documents)
+        report = {
+            "chunks_in": len(documents),
+            "chunks_out": len(kept),
+            "chunks_removed": len(documents) - len(kept),
+            "chars_removed": removed_chars,
+            "embedding_work_avoided": removed_chars / total_chars if total_chars else 0.0,
+        }
+        return kept, report
@@ -0,0 +1,86 @@
+# embeddings.py
+"""Pluggable embedding backends and per-index embedding metadata.
+
+Every index records which backend/model built it (index_meta.json inside the
+persist directory), so query-time embeddings always match the stored vectors.
+"""
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+from index_store import INDEX_META_FILE
+
+try:
+    from langchain_ollama import OllamaEmbeddings
+except ImportError:
+    from langchain_community.embeddings import OllamaEmbeddings
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+DEFAULT_BACKEND = os.getenv("AIDE_EMBEDDING_BACKEND", "ollama")
+DEFAULT_MODELS = {
+    "ollama": "llama3",
+    # Small local CPU model (384 dimensions), as used by the original ingest.py
+    "sentence-transformers": "all-MiniLM-L6-v2",
+}
+
+
+def _sentence_transformer_embeddings(model: str):
+    try:
+        from langchain_huggingface import HuggingFaceEmbeddings
+    except ImportError:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=model,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"normalize_embeddings": True}
+    )
+
+
+def resolve_embedding_model(backend: Optional[str] = None, model: Optional[str] = None) -> Tuple[str, str]:
+    """The (backend, model) get_embeddings uses: explicit values, then AIDE_EMBEDDING_* variables, then defaults"""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in DEFAULT_MODELS:
+        raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(DEFAULT_MODELS)})")
+    return backend, model or os.getenv("AIDE_EMBEDDING_MODEL") or DEFAULT_MODELS[backend]
+
+
+def get_embeddings(backend: Optional[str] = None, model: Optional[str] = None):
+    """Create an embedding function for the given backend and model"""
+    backend, model = resolve_embedding_model(backend, model)
+
+    if backend == "ollama":
+        return OllamaEmbeddings(model=model, base_url=OLLAMA_BASE_URL)
+    return _sentence_transformer_embeddings(model)
+
+
+def embedding_dimension(embeddings) -> int:
+    """Probe the vector size produced by an embedding function"""
+    return len(embeddings.embed_query("dimension probe"))
+
+
+def write_index_meta(persist_directory: str, backend: str, model: str, dimension: int, **extra):
+    """Record the embedding backend, model and dimension an index was built with"""
+    meta = {"embedding_backend": backend, "embedding_model": model, "dimension": dimension}
+    meta.update(extra)
+    os.makedirs(persist_directory, exist_ok=True)
+    with open(os.path.join(persist_directory, INDEX_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def read_index_meta(persist_directory: str) -> Optional[Dict]:
+    """Read index metadata, or None for indexes built before metadata was recorded"""
+    path = os.path.join(persist_directory, INDEX_META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def embeddings_for_index(persist_directory: str):
+    """Create the embedding function matching the vectors stored in an index"""
+    meta = read_index_meta(persist_directory)
+    if meta is None:
+        # Indexes without metadata were all built with llama3 through Ollama
+        return get_embeddings("ollama", "llama3")
+    return get_embeddings(meta["embedding_backend"], meta["embedding_model"])
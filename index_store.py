@@ -0,0 +1,171 @@
+# index_store.py
+"""Versioned company index builds with an atomic "current" pointer.
+
+Every build goes into a fresh directory under chroma_db_company_versions/.
+Publishing rewrites the small pointer file chroma_db_company.current with
+os.replace, which is atomic, so readers see either the old or the new
+version, never a half-written index. Running AIDEAgents instances poll the
+pointer and swap retrievers in the background. Old versions are
+garbage-collected, keeping the newest few for in-flight readers and rollback.
+
+Usage:
+    python index_store.py status
+    python index_store.py publish <version>     # roll back / forward
+    python index_store.py gc --keep 2
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Optional
+
+INDEX_ROOT = "./chroma_db_company_versions"
+# Written last by every build (see embeddings.write_index_meta): its presence marks a complete version
+INDEX_META_FILE = "index_meta.json"
+# Incomplete versions older than this are leftovers of crashed builds, not builds in progress
+STALE_BUILD_SECONDS = 3600
+POINTER_FILE = "./chroma_db_company.current"
+# Unversioned index used until the first versioned build is published
+LEGACY_DIRECTORY = "./chroma_db_company"
+
+
+def new_version_directory(root: str = INDEX_ROOT):
+    """Reserve a fresh, empty directory for a new index build"""
+    version = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    path = os.path.join(root, version)
+    os.makedirs(path)
+    return version, path
+
+
+def discard_version(version: str, root: str = INDEX_ROOT):
+    """Remove the directory of a failed build so it is never mistaken for a version"""
+    shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+
+def is_complete(version: str, root: str = INDEX_ROOT) -> bool:
+    return os.path.exists(os.path.join(root, version, INDEX_META_FILE))
+
+
+def read_pointer(pointer_file: str = POINTER_FILE) -> Optional[dict]:
+    if not os.path.exists(pointer_file):
+        return None
+    with open(pointer_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def publish_version(version: str, root: str = INDEX_ROOT, pointer_file: str = POINTER_FILE):
+    """Atomically point readers at a completed version"""
+    path = os.path.join(root, version)
+    if not os.path.isdir(path):
+        raise ValueError(f"Index version does not exist: {path}")
+    if not is_complete(version, root):
+        raise ValueError(f"Index version is incomplete (no {INDEX_META_FILE}): {path}")
+
+    pointer = {"version": version, "path": path, "published_at": time.time()}
+    temp_file = f"{pointer_file}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(pointer, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, pointer_file)
+    return pointer
+
+
+def current_index_directory(pointer_file: str = POINTER_FILE) -> str:
+    pointer = read_pointer(pointer_file)
+    return pointer["path"] if pointer else LEGACY_DIRECTORY
+
+
+def current_version(pointer_file: str = POINTER_FILE) -> str:
+    pointer = read_pointer(pointer_file)
+    return pointer["version"] if pointer else "legacy"
+
+
+def list_versions(root: str = INDEX_ROOT):
+    if not os.path.isdir(root):
+        return []
+    # Version names start with a timestamp, so name order is build order
+    return sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+
+
+def garbage_collect(keep: int = 2, root: str = INDEX_ROOT, pointer_file: str = POINTER_FILE):
+    """Delete all but the newest `keep` complete versions; the current version is never deleted
+
+    Incomplete versions do not count towards `keep`: they are removed once stale,
+    and left alone while they may still be a build in progress.
+    """
+    current = current_version(pointer_file)
+    removed = []
+    versions = list_versions(root)
+    complete = [version for version in versions if is_complete(version, root)]
+    for version in complete[:-keep or None]:
+        if version == current:
+            continue
+        discard_version(version, root)
+        removed.append(version)
+    for version in versions:
+        if version in complete or version == current:
+            continue
+        if time.time() - os.path.getmtime(os.path.join(root, version)) > STALE_BUILD_SECONDS:
+            discard_version(version, root)
+            removed.append(version)
+    return removed
+
+
+class IndexWatcher:
+    """Cheap, throttled check for a newly published index version"""
+
+    def __init__(self, poll_interval: float = 5.0, pointer_file: str = POINTER_FILE):
+        self.poll_interval = poll_interval
+        self.pointer_file = pointer_file
+        self.version = current_version(pointer_file)
+        self._next_check = time.monotonic() + poll_interval
+
+    def poll(self) -> Optional[dict]:
+        """Return the pointer of a version published since the last loaded one
+
+        The watcher keeps reporting it until mark_loaded() is called, so a
+        version whose swap was skipped or failed is picked up on a later poll.
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return None
+        self._next_check = now + self.poll_interval
+
+        try:
+            pointer = read_pointer(self.pointer_file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading index pointer: {e}")
+            return None
+        if pointer is None or pointer["version"] == self.version:
+            return None
+        return pointer
+
+    def mark_loaded(self, version: str):
+        self.version = version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage versioned company index builds")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status")
+    publish_parser = subparsers.add_parser("publish")
+    publish_parser.add_argument("version")
+    gc_parser = subparsers.add_parser("gc")
+    gc_parser.add_argument("--keep", type=int, default=2)
+    args = parser.parse_args()
+
+    if args.command == "status":
+        current = current_version()
+        print(f"Current version: {current} ({current_index_directory()})")
+        for version in list_versions():
+            state = "" if is_complete(version) else "  (incomplete)"
+            print(f"{'*' if version == current else ' '} {version}{state}")
+    elif args.command == "publish":
+        pointer = publish_version(args.version)
+        print(f"✅ Published {pointer['version']}")
+    else:
+        removed = garbage_collect(args.keep)
+        print(f"🧹 Removed {len(removed)} old index versions: {', '.join(removed) or '-'}")
@@ -0,0 +1,113 @@
+# migrate_index.py
+"""Re-index the company index with a different embedding backend/model.
+
+Chunks are read back out of the current index version (no re-parsing of
+company_data), re-embedded into a new version directory, and published only
+once the new index is complete. The current version keeps serving queries
+during the rebuild, and running agents switch over on their next poll.
+
+Usage:
+    python migrate_index.py --embedding-backend sentence-transformers
+    python migrate_index.py --embedding-backend ollama --embedding-model llama3
+"""
+import argparse
+import os
+import time
+
+from embeddings import (
+    DEFAULT_MODELS, embedding_dimension, embeddings_for_index, get_embeddings,
+    read_index_meta, resolve_embedding_model, write_index_meta
+)
+from index_store import current_index_directory, discard_version, new_version_directory, publish_version
+from tenants import collection_name, index_tenants, open_partitions
+
+try:
+    from langchain_chroma import Chroma
+except ImportError:
+    from langchain_community.vectorstores import Chroma
+
+BATCH_SIZE = 64
+
+
+def read_chunks(source_db):
+    """Read all chunk texts, metadata and ids back out of an existing collection"""
+    data = source_db.get(include=["documents", "metadatas"])
+    return data["ids"], data["documents"], data["metadatas"]
+
+
+def build_index(target_directory: str, ids, texts, metadatas, embeddings, tenant: str = None):
+    """Embed chunks in batches into a fresh index directory (a tenant's collection if given)"""
+    if tenant is None:
+        target_db = Chroma(persist_directory=target_directory, embedding_function=embeddings)
+    else:
+        target_db = Chroma(collection_name=collection_name(tenant), persist_directory=target_directory,
+                           embedding_function=embeddings)
+    for start in range(0, len(texts), BATCH_SIZE):
+        end = start + BATCH_SIZE
+        target_db.add_texts(
+            texts=texts[start:end],
+            metadatas=metadatas[start:end],
+            ids=ids[start:end]
+        )
+        print(f"  Embedded {min(end, len(texts))}/{len(texts)} chunks")
+    return target_db
+
+
+def migrate_index(embedding_backend: str, embedding_model: str = None, persist_directory: str = None):
+    persist_directory = persist_directory or current_index_directory()
+    # Same resolution as get_embeddings (AIDE_EMBEDDING_MODEL included), so index_meta.json records the model used
+    embedding_backend, embedding_model = resolve_embedding_model(embedding_backend, embedding_model)
+    old_meta = read_index_meta(persist_directory) or {"embedding_backend": "ollama", "embedding_model": "llama3"}
+    print(f"Migrating {persist_directory}: "
+          f"{old_meta['embedding_backend']}/{old_meta['embedding_model']} -> {embedding_backend}/{embedding_model}")
+
+    # Unpartitioned indexes keep their single default collection
+    tenants = index_tenants(persist_directory)
+    partitions = open_partitions(persist_directory, embeddings_for_index(persist_directory))
+    chunks = {tenant: read_chunks(source_db) for tenant, source_db in partitions.items()}
+    total = sum(len(texts) for _, texts, _ in chunks.values())
+    if not total:
+        print("Source index is empty, nothing to migrate")
+        return
+
+    embeddings = get_embeddings(embedding_backend, embedding_model)
+    dimension = embedding_dimension(embeddings)
+
+    version, target_directory = new_version_directory()
+    start = time.perf_counter()
+    try:
+        for tenant, (ids, texts, metadatas) in chunks.items():
+            build_index(target_directory, ids, texts, metadatas, embeddings, tenant if tenants else None)
+        extra = {"tenants": tenants} if tenants else {}
+        write_index_meta(target_directory, embedding_backend, embedding_model, dimension,
+                         migrated_from=f"{old_meta['embedding_backend']}/{old_meta['embedding_model']}", **extra)
+    except Exception as e:
+        # A partial build must not linger: it would sort as the newest version
+        discard_version(version)
+        print(f"Migration failed, discarded version {version}: {e}")
+        return
+    print(f"Built new index in {time.perf_counter() - start:.1f}s")
+
+    if os.getenv("AIDE_RETRIEVER") == "quantized":
+        # The compact index travels with its version; if it fails, agents serve this version from Chroma
+        from quantized_index import build_from_chroma
+        try:
+            build_from_chroma(target_directory)
+        except Exception as e:
+            print(f"Error building compact int8 index: {e}")
+
+    # Publish only after the new index is complete; the old version stays for rollback
+    publish_version(version)
+
+    print("✅ Migration completed!")
+    print(f"📊 Re-indexed {total} document chunks ({dimension} dimensions)")
+    print(f"💾 New index version {version}; roll back with `python index_store.py publish <version>`")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-index the company vector database with another embedding model")
+    parser.add_argument("--embedding-backend", required=True, choices=sorted(DEFAULT_MODELS))
+    parser.add_argument("--embedding-model", help="Model name for the chosen backend")
+    parser.add_argument("--persist-directory", help="Source index (defaults to the current version)")
+    args = parser.parse_args()
+    migrate_index(args.embedding_backend, args.embedding_model, args.persist_directory)
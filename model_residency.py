@@ -0,0 +1,143 @@
+# model_residency.py
+"""Keep the Ollama model resident and measure load and prompt-eval costs.
+
+Ollama unloads an idle model after its keep-alive expires, and the next user
+pays a multi-second cold load. The residency manager passes an explicit
+keep_alive to every LLM client, sends periodic warm pings so the model never
+idles out, and records the load_duration / prompt_eval_* timings Ollama
+returns with every generation. Cold loads absorbed by pings and prompt
+tokens served from Ollama's prefix cache are reported as savings.
+"""
+import json
+import os
+import threading
+import time
+import urllib.request
+from typing import Dict
+
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+except ImportError:
+    from langchain.callbacks.base import BaseCallbackHandler
+
+KEEP_ALIVE = os.getenv("AIDE_OLLAMA_KEEP_ALIVE", "30m")
+WARM_INTERVAL_SECONDS = float(os.getenv("AIDE_OLLAMA_WARM_INTERVAL", "240"))
+COLD_LOAD_THRESHOLD_MS = 500.0
+CHARS_PER_TOKEN = 4.0
+
+
+class OllamaMetricsCallback(BaseCallbackHandler):
+    """Feed the timing fields of each Ollama generation into the residency manager"""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._prompt_chars = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs):
+        self._prompt_chars[run_id] = sum(len(p) for p in prompts)
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        prompt_chars = self._prompt_chars.pop(run_id, 0)
+        for generations in response.generations:
+            for generation in generations:
+                self.manager.record_generation(generation.generation_info or {}, prompt_chars)
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs):
+        self._prompt_chars.pop(run_id, None)
+
+
+class ModelResidencyManager:
+    def __init__(self, base_url: str, model: str, keep_alive: str = KEEP_ALIVE,
+                 warm_interval: float = WARM_INTERVAL_SECONDS):
+        self.base_url = base_url
+        self.model = model
+        self.keep_alive = keep_alive
+        self.warm_interval = warm_interval
+        self.callback = OllamaMetricsCallback(self)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {
+            "generations": 0,
+            "cold_loads": 0,
+            "cold_load_ms_total": 0.0,
+            "warm_pings": 0,
+            "warm_ping_failures": 0,
+            "cold_loads_absorbed_by_pings": 0,
+            "absorbed_load_ms_total": 0.0,
+            "prompt_tokens_estimated": 0,
+            "prompt_tokens_evaluated": 0,
+            "prompt_eval_ms_total": 0.0,
+        }
+
+    def llm_kwargs(self) -> Dict:
+        """Keyword arguments for every Ollama(...) client sharing this model"""
+        return {"keep_alive": self.keep_alive, "callbacks": [self.callback]}
+
+    def record_generation(self, info: Dict, prompt_chars: int = 0):
+        load_ms = info.get("load_duration", 0) / 1e6
+        with self._lock:
+            self.stats["generations"] += 1
+            if load_ms > COLD_LOAD_THRESHOLD_MS:
+                self.stats["cold_loads"] += 1
+                self.stats["cold_load_ms_total"] += load_ms
+            # Ollama only evaluates the prompt suffix that is not already in its KV cache
+            self.stats["prompt_tokens_estimated"] += int(prompt_chars / CHARS_PER_TOKEN)
+            self.stats["prompt_tokens_evaluated"] += info.get("prompt_eval_count", 0)
+            self.stats["prompt_eval_ms_total"] += info.get("prompt_eval_duration", 0) / 1e6
+
+    def ping(self) -> bool:
+        """Load the model if needed and refresh its keep-alive without generating anything"""
+        payload = json.dumps({"model": self.model, "prompt": "", "keep_alive": self.keep_alive, "stream": False})
+        request = urllib.request.Request(
+            f"{self.base_url}/api/generate",
+            data=payload.encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                info = json.loads(response.read().decode("utf-8"))
+        except Exception as e:
+            print(f"Ollama warm ping failed: {e}")
+            with self._lock:
+                self.stats["warm_ping_failures"] += 1
+            return False
+
+        load_ms = info.get("load_duration", 0) / 1e6
+        with self._lock:
+            self.stats["warm_pings"] += 1
+            if load_ms > COLD_LOAD_THRESHOLD_MS:
+                # A load that happened here instead of in front of a user
+                self.stats["cold_loads_absorbed_by_pings"] += 1
+                self.stats["absorbed_load_ms_total"] += load_ms
+        return True
+
+    def _warm_loop(self):
+        while True:
+            self.ping()
+            time.sleep(self.warm_interval)
+
+    def start(self):
+        """Pre-load the model now and keep it warm in a background thread"""
+        if self.warm_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._warm_loop, daemon=True)
+        self._thread.start()
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        generations = stats["generations"] or 1
+        evaluated = stats["prompt_tokens_evaluated"]
+        ms_per_token = stats["prompt_eval_ms_total"] / evaluated if evaluated else 0.0
+        reused = max(0, stats["prompt_tokens_estimated"] - evaluated)
+
+        stats.update({
+            "model": self.model,
+            "keep_alive": self.keep_alive,
+            "cold_load_rate": stats["cold_loads"] / generations,
+            "prompt_tokens_reused_estimate": reused,
+            "prompt_eval_ms_saved_estimate": reused * ms_per_token,
+            # Measured on the pings themselves: when they work, users hit no cold loads to average
+            "cold_start_ms_saved_estimate": stats["absorbed_load_ms_total"],
+        })
+        return stats
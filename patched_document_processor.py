@@ -1,9 +1,16 @@
 # patched_document_processor.py
 import os
-from typing import List
-import pandas as pd
+import time
+from typing import Dict, Iterator, List
 from langchain.docstore.document import Document as LangchainDocument
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from artifact_store import ArtifactStore
+from dedup import MinHashDeduplicator
+from tenants import load_manifest, tenant_for_file
+from spreadsheet_reader import (
+    ROWS_PER_GROUP, csv_row_group_documents, excel_row_group_documents, iter_csv_rows, iter_excel_rows
+)
+from text_reader import iter_clean_text, split_text_stream, text_kind, with_encoding_fallback
 
 # Import only the specific partition functions we need, avoiding the problematic pdf module
 try:
@@ -18,175 +25,212 @@ except ImportError as e:
 import PyPDF2
 import pdfplumber
 
+# Bump a parser's version whenever its extracted output changes, so cached
+# artifacts from the old parser are ignored (and pruned by artifact_store.py)
+PARSER_VERSIONS = {
+    "pdf": 1,
+    "docx": 1,
+    "ppt": 1,
+    # 2: full-sheet scan despite wrong <dimension> elements, single-row sheets kept
+    # 3: one unit per row; rows are grouped at chunking time, not cached as groups
+    "excel": 3,
+    "csv": 3,
+    # Text files are cached per cleaner, since identical bytes clean differently as HTML or Markdown
+    "text": 3,
+    "markdown": 1,
+    "html": 1,
+}
+
+# Estimated Jaccard similarity above which chunks are collapsed; 0 disables dedup
+DEDUP_THRESHOLD = float(os.getenv("AIDE_DEDUP_THRESHOLD", "0.8"))
+
 class DocumentProcessor:
-    def __init__(self):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, artifact_store: ArtifactStore = None,
+                 dedup_threshold: float = DEDUP_THRESHOLD, rows_per_group: int = ROWS_PER_GROUP):
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
         )
+        # Spreadsheet chunking: rows are cached individually and grouped per run
+        self.rows_per_group = rows_per_group
+        # Parsed units are cached by file content, so splitter changes only re-chunk
+        self.artifact_store = artifact_store if artifact_store is not None else ArtifactStore()
+        self.deduplicator = MinHashDeduplicator(threshold=dedup_threshold) if dedup_threshold > 0 else None
+    
+    def _load_units(self, file_path: str, parser: str, parse_fn) -> List[Dict]:
+        """Extracted text units of a file, from the artifact cache when possible"""
+        return self.artifact_store.get_or_parse(file_path, parser, PARSER_VERSIONS[parser], parse_fn)
+    
+    def _unit_documents(self, file_path: str, units: List[Dict]) -> List[LangchainDocument]:
+        return [
+            LangchainDocument(
+                page_content=unit["text"],
+                metadata={"source": file_path, "filename": os.path.basename(file_path), **unit["metadata"]}
+            )
+            for unit in units
+        ]
+    
+    def _split_joined_units(self, file_path: str, units: List[Dict], doc_type: str, separator: str = "\n") -> List[LangchainDocument]:
+        """Join a file's units into one document and split it into chunks"""
+        documents = [LangchainDocument(
+            page_content=separator.join(unit["text"] for unit in units),
+            metadata={"source": file_path, "type": doc_type, "filename": os.path.basename(file_path)}
+        )]
+        return self.text_splitter.split_documents(documents)
+    
+    def _parse_pdf(self, file_path: str) -> List[Dict]:
+        units = []
+        
+        # Method 1: Extract text with PyPDF2
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page_num, page in enumerate(pdf_reader.pages):
+                text = page.extract_text()
+                if text.strip():
+                    units.append({"text": text, "metadata": {"type": "pdf", "page": page_num + 1}})
+        
+        # Method 2: Extract tables with pdfplumber
+        try:
+            with pdfplumber.open(file_path) as pdf:
+                for page_num, page in enumerate(pdf.pages):
+                    tables = page.extract_tables()
+                    for table_num, table in enumerate(tables):
+                        if table:
+                            table_text = "\n".join(["\t".join(map(str, row)) for row in table])
+                            units.append({
+                                "text": f"Table {table_num + 1}:\n{table_text}",
+                                "metadata": {"type": "pdf_table", "page": page_num + 1, "table": table_num + 1}
+                            })
+        except Exception as e:
+            print(f"PDF table extraction error {file_path}: {e}")
+        
+        return units
     
     def process_pdf(self, file_path: str) -> List[LangchainDocument]:
         """Process PDF files using PyPDF2 and pdfplumber for text and tables"""
-        documents = []
-        
         try:
-            # Method 1: Extract text with PyPDF2
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num, page in enumerate(pdf_reader.pages):
-                    text = page.extract_text()
-                    if text.strip():
-                        documents.append(LangchainDocument(
-                            page_content=text,
-                            metadata={
-                                "source": file_path, 
-                                "type": "pdf", 
-                                "filename": os.path.basename(file_path),
-                                "page": page_num + 1
-                            }
-                        ))
-            
-            # Method 2: Extract tables with pdfplumber
-            try:
-                with pdfplumber.open(file_path) as pdf:
-                    for page_num, page in enumerate(pdf.pages):
-                        tables = page.extract_tables()
-                        for table_num, table in enumerate(tables):
-                            if table:
-                                table_text = "\n".join(["\t".join(map(str, row)) for row in table])
-                                documents.append(LangchainDocument(
-                                    page_content=f"Table {table_num + 1}:\n{table_text}",
-                                    metadata={
-                                        "source": file_path, 
-                                        "type": "pdf_table", 
-                                        "filename": os.path.basename(file_path),
-                                        "page": page_num + 1,
-                                        "table": table_num + 1
-                                    }
-                                ))
-            except Exception as e:
-                print(f"PDF table extraction error {file_path}: {e}")
-                
+            return self._unit_documents(file_path, self._load_units(file_path, "pdf", self._parse_pdf))
         except Exception as e:
             print(f"Error processing PDF file {file_path}: {e}")
-        
-        return documents
+            return []
+    
+    def _parse_docx(self, file_path: str) -> List[Dict]:
+        # Use python-docx instead of unstructured
+        import docx
+        doc = docx.Document(file_path)
+        return [
+            {"text": paragraph.text, "metadata": {"type": "docx"}}
+            for paragraph in doc.paragraphs if paragraph.text.strip()
+        ]
     
     def process_docx(self, file_path: str) -> List[LangchainDocument]:
         """Process DOCX files"""
         try:
-            # Use python-docx instead of unstructured
-            import docx
-            doc = docx.Document(file_path)
-            content = "\n".join([paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()])
-            
-            documents = [LangchainDocument(
-                page_content=content,
-                metadata={"source": file_path, "type": "docx", "filename": os.path.basename(file_path)}
-            )]
-            
-            return self.text_splitter.split_documents(documents)
+            units = self._load_units(file_path, "docx", self._parse_docx)
+            return self._split_joined_units(file_path, units, "docx")
         except Exception as e:
             print(f"Error processing DOCX file {file_path}: {e}")
             return []
     
+    def _parse_excel(self, file_path: str) -> List[Dict]:
+        # One read-only workbook open; rows are iterated, never loaded as whole sheets
+        return [
+            {"text": line, "metadata": {"type": "excel", "sheet": sheet_name, "row": row_number}}
+            for sheet_name, row_number, line in iter_excel_rows(file_path)
+        ]
+    
     def process_excel(self, file_path: str) -> List[LangchainDocument]:
-        """Process Excel files, extract all worksheet data"""
-        documents = []
-        
+        """Process Excel files, grouping the rows of every worksheet into row-group documents"""
         try:
-            # Read all worksheets
-            excel_file = pd.ExcelFile(file_path)
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                
-                # Convert DataFrame to readable text format
-                sheet_content = f"Worksheet: {sheet_name}\n\n"
-                sheet_content += df.to_string(index=False)
-                
-                documents.append(LangchainDocument(
-                    page_content=sheet_content,
-                    metadata={"source": file_path, "type": "excel", "sheet": sheet_name, "filename": os.path.basename(file_path)}
-                ))
+            units = self._load_units(file_path, "excel", self._parse_excel)
+            rows = ((unit["metadata"]["sheet"], unit["metadata"]["row"], unit["text"]) for unit in units)
+            return list(excel_row_group_documents(file_path, rows, self.rows_per_group))
         except Exception as e:
             print(f"Error processing Excel file {file_path}: {e}")
+            return []
+    
+    def _parse_ppt(self, file_path: str) -> List[Dict]:
+        from pptx import Presentation
+        prs = Presentation(file_path)
+        units = []
+        
+        for slide_num, slide in enumerate(prs.slides):
+            slide_content = []
+            for shape in slide.shapes:
+                if hasattr(shape, "text") and shape.text.strip():
+                    slide_content.append(shape.text)
+            
+            if slide_content:
+                units.append({
+                    "text": f"Slide {slide_num + 1}:\n" + "\n".join(slide_content),
+                    "metadata": {"type": "ppt", "slide": slide_num + 1}
+                })
         
-        return documents
+        return units
     
     def process_ppt(self, file_path: str) -> List[LangchainDocument]:
         """Process PPT files using python-pptx"""
         try:
-            from pptx import Presentation
-            prs = Presentation(file_path)
-            content = []
-            
-            for slide_num, slide in enumerate(prs.slides):
-                slide_content = []
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        slide_content.append(shape.text)
-                
-                if slide_content:
-                    content.append(f"Slide {slide_num + 1}:\n" + "\n".join(slide_content))
-            
-            full_content = "\n\n".join(content)
-            
-            documents = [LangchainDocument(
-                page_content=full_content,
-                metadata={"source": file_path, "type": "ppt", "filename": os.path.basename(file_path)}
-            )]
-            
-            return self.text_splitter.split_documents(documents)
+            units = self._load_units(file_path, "ppt", self._parse_ppt)
+            return self._split_joined_units(file_path, units, "ppt", separator="\n\n")
         except Exception as e:
             print(f"Error processing PPT file {file_path}: {e}")
             return []
     
+    def _parse_text_file(self, file_path: str, encoding: str, kind: str) -> Iterator[Dict]:
+        # The file is decoded and cleaned block by block, one section at a time
+        for text in iter_clean_text(file_path, encoding, kind):
+            yield {"text": text, "metadata": {"type": "text", "encoding": encoding}}
+    
     def process_text_file(self, file_path: str) -> List[LangchainDocument]:
-        """Process text files (TXT, MD, etc.)"""
+        """Process text files (TXT, MD, HTML), stripping markup before chunking"""
         try:
-            # Detect file encoding
-            encodings = ['utf-8', 'gbk', 'gb2312', 'latin-1']
-            content = None
-            
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    break
-                except UnicodeDecodeError:
-                    continue
-            
-            if content is None:
-                print(f"Cannot decode file: {file_path}")
-                return []
-            
-            documents = [LangchainDocument(
-                page_content=content,
-                metadata={"source": file_path, "type": "text", "filename": os.path.basename(file_path)}
-            )]
-            
-            return self.text_splitter.split_documents(documents)
+            kind = text_kind(file_path)
+            # Sections are written to the artifact store as they are cleaned and read back
+            # lazily, so a large log never sits in memory whole
+            units = with_encoding_fallback(file_path, lambda encoding: self.artifact_store.iter_or_parse(
+                file_path, kind, PARSER_VERSIONS[kind],
+                lambda path: self._parse_text_file(path, encoding, kind)
+            ))
+            metadata = {"source": file_path, "type": "text", "filename": os.path.basename(file_path)}
+            chunks = split_text_stream(self.text_splitter, (unit["text"] for unit in units))
+            return [LangchainDocument(page_content=chunk, metadata=dict(metadata)) for chunk in chunks]
         except Exception as e:
             print(f"Error processing text file {file_path}: {e}")
             return []
     
+    def _parse_csv(self, file_path: str) -> List[Dict]:
+        return [
+            {"text": line, "metadata": {"type": "csv", "row": row_number}}
+            for row_number, line in iter_csv_rows(file_path)
+        ]
+    
     def process_csv(self, file_path: str) -> List[LangchainDocument]:
-        """Process CSV files"""
+        """Process CSV files, grouping rows into row-group documents"""
         try:
-            df = pd.read_csv(file_path)
-            content = f"CSV File: {os.path.basename(file_path)}\n\n"
-            content += df.to_string(index=False)
-            
-            documents = [LangchainDocument(
-                page_content=content,
-                metadata={"source": file_path, "type": "csv", "filename": os.path.basename(file_path)}
-            )]
-            
-            return documents
+            units = self._load_units(file_path, "csv", self._parse_csv)
+            rows = ((unit["metadata"]["row"], unit["text"]) for unit in units)
+            return list(csv_row_group_documents(file_path, rows, self.rows_per_group))
         except Exception as e:
             print(f"Error processing CSV file {file_path}: {e}")
             return []
     
+    def _deduplicate_per_tenant(self, documents: List[LangchainDocument]):
+        """Collapse near-duplicates within each tenant; partitions never share chunks"""
+        by_tenant = {}
+        for document in documents:
+            by_tenant.setdefault(document.metadata.get("tenant"), []).append(document)
+        kept = []
+        report = {"chunks_in": 0, "chunks_out": 0, "chunks_removed": 0, "chars_removed": 0}
+        for tenant_documents in by_tenant.values():
+            tenant_kept, tenant_report = self.deduplicator.deduplicate(tenant_documents)
+            kept.extend(tenant_kept)
+            for key in report:
+                report[key] += tenant_report[key]
+        total_chars = sum(len(document.page_content) for document in documents)
+        report["embedding_work_avoided"] = report["chars_removed"] / total_chars if total_chars else 0.0
+        return kept, report
+    
     def process_directory(self, data_directory: str) -> List[LangchainDocument]:
         """Process all supported files in the directory"""
         all_documents = []
@@ -196,6 +240,7 @@ class DocumentProcessor:
             '.docx': self.process_docx,
             '.xlsx': self.process_excel,
             '.xls': self.process_excel,
+            '.xlsm': self.process_excel,
             '.csv': self.process_csv,
             '.ppt': self.process_ppt,
             '.pptx': self.process_ppt,
@@ -209,6 +254,7 @@ class DocumentProcessor:
             print(f"Data directory does not exist: {data_directory}")
             return all_documents
         
+        manifest = load_manifest(data_directory)
         processed_count = 0
         for root, _, files in os.walk(data_directory):
             for file in files:
@@ -218,18 +264,32 @@ class DocumentProcessor:
                 if file_ext in file_processors:
                     try:
                         print(f"Processing: {file_path}")
+                        start = time.perf_counter()
                         documents = file_processors[file_ext](file_path)
+                        elapsed = time.perf_counter() - start
                         if documents:
+                            # Partition key for rag_setup.py: one collection per tenant
+                            tenant = tenant_for_file(file_path, data_directory, manifest)
+                            for document in documents:
+                                document.metadata["tenant"] = tenant
                             all_documents.extend(documents)
                             processed_count += 1
-                            print(f"✓ Successfully processed {file}, generated {len(documents)} document chunks")
+                            print(f"✓ Successfully processed {file}, generated {len(documents)} document chunks ({elapsed:.2f}s)")
                         else:
                             print(f"✗ Processing {file} generated no content")
                     except Exception as e:
                         print(f"Error processing file {file}: {e}")
         
+        cache_stats = self.artifact_store.stats
         print(f"\nProcessing completed! Processed {processed_count} files, generated {len(all_documents)} document chunks")
+        print(f"Parsed-artifact cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+        
+        if self.deduplicator and all_documents:
+            all_documents, report = self._deduplicate_per_tenant(all_documents)
+            print(f"Near-duplicate removal: {report['chunks_in']} -> {report['chunks_out']} chunks "
+                  f"({report['chunks_removed']} collapsed, {report['chars_removed']} characters, "
+                  f"{report['embedding_work_avoided']:.1%} of embedding work avoided)")
         return all_documents
 
 # Global instance
-document_processor = DocumentProcessor()
\ No newline at end of file
+document_processor = DocumentProcessor()
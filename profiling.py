@@ -0,0 +1,141 @@
+# profiling.py
+"""On-demand CPU and memory profiling of the agent and ingestion hot paths.
+
+A profiled call writes, to AIDE_PROFILE_DIR (default ./profiles):
+    <stamp>-<name>-<ms>ms.prof        cProfile stats (pstats, snakeviz, gprof2dot)
+    <stamp>-<name>-<ms>ms.tracemalloc allocation snapshot (tracemalloc.Snapshot.load)
+    <stamp>-<name>-<ms>ms.memory.txt  peak traced memory and top allocation sites
+
+The gateway profiles a /chat request when it carries `X-AIDE-Profile: 1`, and
+additionally samples AIDE_PROFILE_SAMPLE_RATE (default 1%) of all requests, keeping only
+the AIDE_PROFILE_KEEP slowest sampled profiles. `rag_setup.py --profile`
+profiles document processing. Profiled calls run one at a time, since only one
+profiler can be active per process; tracemalloc sees all threads, so memory
+snapshots of concurrent requests include their neighbours' allocations.
+
+cProfile records only the calling thread. Work handed to other threads is
+missing from the .prof: cross-encoder scoring in the Reranker pool shows up as
+time waiting on a future, and a request that joined another's single-flight
+call shows only the wait. Profile re-ranking with AIDE_RERANK_BUDGET_MS and
+rag_eval.py, or run the scorer directly under cProfile.
+
+Usage:
+    python -c "import pstats; pstats.Stats('profiles/<file>.prof').sort_stats('cumtime').print_stats(30)"
+"""
+import cProfile
+import heapq
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+from typing import Dict, Optional, Tuple
+
+PROFILE_DIR = os.getenv("AIDE_PROFILE_DIR", "./profiles")
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 25
+
+
+class Profiler:
+    def __init__(self, directory: str = PROFILE_DIR, memory: bool = True,
+                 sample_rate: float = 0.0, keep_slowest: int = 20):
+        self.directory = directory
+        self.memory = memory
+        self.sample_rate = sample_rate
+        self.keep_slowest = keep_slowest
+        self._lock = threading.Lock()
+        self._slowest = []  # min-heap of (seconds, files) for kept sampled profiles
+        self._slowest_lock = threading.Lock()
+        self.stats = {"profiled": 0, "sampled": 0, "sampled_kept": 0, "skipped_busy": 0}
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def run(self, name: str, fn, *args, sampled: bool = False, **kwargs) -> Tuple[object, Optional[Dict]]:
+        """Call fn under cProfile (and tracemalloc); returns (result, profile info or None)
+
+        Sampled runs never wait for another profile to finish and are kept only
+        while they are among the slowest sampled runs.
+        """
+        if not self._lock.acquire(blocking=not sampled):
+            self.stats["skipped_busy"] += 1
+            return fn(*args, **kwargs), None
+
+        files = []
+        started_tracing = False
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            if self.memory and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                started_tracing = True
+            profile.enable()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                seconds = time.perf_counter() - start
+                snapshot = tracemalloc.take_snapshot() if self.memory and tracemalloc.is_tracing() else None
+                peak = tracemalloc.get_traced_memory()[1] if snapshot is not None else 0
+                if started_tracing:
+                    tracemalloc.stop()
+                files = self._write(name, seconds, profile, snapshot, peak)
+        finally:
+            self._lock.release()
+
+        self.stats["profiled"] += 1
+        if sampled:
+            self.stats["sampled"] += 1
+            if not self._keep_if_slow(seconds, files):
+                return result, None
+        return result, {"seconds": seconds, "files": files}
+
+    def _write(self, name: str, seconds: float, profile, snapshot, peak: int):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{int(time.time() * 1000) % 1000:03d}"
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+        base = os.path.join(self.directory, f"{stamp}-{safe_name}-{seconds * 1000:.0f}ms")
+
+        profile.dump_stats(base + ".prof")
+        files = [base + ".prof"]
+        if snapshot is not None:
+            snapshot.dump(base + ".tracemalloc")
+            with open(base + ".memory.txt", 'w', encoding='utf-8') as f:
+                f.write(f"{name}: {seconds:.3f}s, peak traced memory {peak / 1e6:.1f} MB\n\n")
+                for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+            files += [base + ".tracemalloc", base + ".memory.txt"]
+        return files
+
+    def _keep_if_slow(self, seconds: float, files) -> bool:
+        """Keep a sampled profile if it is among the slowest; delete whatever drops out"""
+        with self._slowest_lock:
+            if self.keep_slowest <= 0:
+                dropped, kept = files, False
+            elif len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, (seconds, files))
+                self.stats["sampled_kept"] += 1
+                return True
+            elif seconds <= self._slowest[0][0]:
+                dropped, kept = files, False
+            else:
+                _, dropped = heapq.heapreplace(self._slowest, (seconds, files))
+                self.stats["sampled_kept"] += 1
+                kept = True
+        for path in dropped:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return kept
+
+
+def profiler_from_env() -> Profiler:
+    return Profiler(
+        directory=PROFILE_DIR,
+        memory=os.getenv("AIDE_PROFILE_MEMORY", "1") != "0",
+        # Sample 1% of requests by default, so the slowest profiles are there when needed
+        sample_rate=float(os.getenv("AIDE_PROFILE_SAMPLE_RATE", "0.01")),
+        keep_slowest=int(os.getenv("AIDE_PROFILE_KEEP", "20"))
+    )
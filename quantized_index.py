@@ -0,0 +1,236 @@
+# quantized_index.py
+"""Compact int8 vector index with exact re-ranking, memory-mapped from disk.
+
+Vectors are scalar-quantized to int8 with one scale per dimension (4x smaller
+than float32). A search scans the int8 codes with NumPy in blocks, keeps the
+best candidates, and re-ranks them exactly against float16 copies of the
+original vectors. Every array is opened with mmap, so only the pages a search
+touches are resident.
+
+The compact index lives inside the index version it was built from
+(<version>/int8/), so it is published, swapped and garbage-collected with it.
+rag_setup.py and migrate_index.py build it automatically when
+AIDE_RETRIEVER=quantized.
+
+Usage:
+    python quantized_index.py build                 # build into the current index version
+    python quantized_index.py report                # footprint and recall vs Chroma
+
+Set AIDE_RETRIEVER=quantized to serve AIDEAgents from the compact index; a
+version without a valid compact index is served from Chroma.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain.docstore.document import Document as LangchainDocument
+
+from embeddings import embeddings_for_index, read_index_meta, write_index_meta
+from index_store import current_index_directory
+from tenants import PartitionedRetriever, index_tenants, open_partitions
+
+try:
+    from langchain_core.retrievers import BaseRetriever
+except ImportError:
+    from langchain.schema import BaseRetriever
+
+QUANTIZED_SUBDIRECTORY = "int8"
+SCAN_BLOCK_ROWS = 8192
+TENANT_OVERFETCH = 4
+
+
+class QuantizedIndex:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.codes = np.load(os.path.join(directory, "codes.int8.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(directory, "scales.npy"))
+        self.sq_norms = np.load(os.path.join(directory, "sq_norms.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(directory, "vectors.f16.npy"), mmap_mode="r")
+
+        self.chunks = []
+        with open(os.path.join(directory, "chunks.jsonl"), 'r', encoding='utf-8') as f:
+            for line in f:
+                self.chunks.append(json.loads(line))
+
+    @staticmethod
+    def build(vectors, texts: List[str], metadatas: List[dict], ids: List[str], directory: str):
+        """Quantize float vectors and write the index files to a directory"""
+        os.makedirs(directory, exist_ok=True)
+        vectors = np.asarray(vectors, dtype=np.float32)
+
+        # Symmetric per-dimension scale: the largest magnitude maps to 127
+        scales = np.abs(vectors).max(axis=0) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+
+        np.save(os.path.join(directory, "codes.int8.npy"), codes)
+        np.save(os.path.join(directory, "scales.npy"), scales.astype(np.float32))
+        np.save(os.path.join(directory, "sq_norms.npy"), np.einsum("ij,ij->i", vectors, vectors))
+        np.save(os.path.join(directory, "vectors.f16.npy"), vectors.astype(np.float16))
+
+        with open(os.path.join(directory, "chunks.jsonl"), 'w', encoding='utf-8') as f:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}}) + "\n")
+
+    def search(self, query_vector, k: int = 5, rerank_factor: int = 8):
+        """Return (row, squared L2 distance) pairs for the k nearest chunks"""
+        if len(self.chunks) == 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        scaled_query = query * self.scales
+        num_candidates = min(len(self.chunks), max(k * rerank_factor, k))
+
+        # ||q - x||^2 = ||x||^2 - 2 q.x + ||q||^2; the last term is constant per query
+        approx = np.empty(len(self.chunks), dtype=np.float32)
+        for start in range(0, len(self.chunks), SCAN_BLOCK_ROWS):
+            block = self.codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            approx[start:start + len(block)] = self.sq_norms[start:start + len(block)] - 2.0 * (block @ scaled_query)
+
+        candidates = np.argpartition(approx, num_candidates - 1)[:num_candidates]
+        candidates.sort()  # sequential reads from the memory-mapped re-rank vectors
+        exact = self.vectors[candidates].astype(np.float32) - query
+        distances = np.einsum("ij,ij->i", exact, exact)
+
+        order = np.argsort(distances)[:k]
+        return [(int(candidates[i]), float(distances[i])) for i in order]
+
+    def documents(self, rows) -> List[LangchainDocument]:
+        results = []
+        for row, _ in rows:
+            chunk = self.chunks[row]
+            results.append(LangchainDocument(page_content=chunk["text"], metadata=chunk["metadata"]))
+        return results
+
+    def memory_footprint(self) -> dict:
+        """Bytes used by the search arrays, the re-rank vectors and a float32 baseline"""
+        rows, dimension = self.codes.shape
+        return {
+            "chunks": rows,
+            "dimension": dimension,
+            "scan_bytes": self.codes.nbytes + self.scales.nbytes + self.sq_norms.nbytes,
+            "rerank_bytes": self.vectors.nbytes,
+            "float32_bytes": rows * dimension * 4,
+        }
+
+
+class QuantizedRetriever(BaseRetriever):
+    """Retriever over a QuantizedIndex, usable in place of a Chroma retriever"""
+    index: Any
+    embeddings: Any
+    k: int = 5
+    rerank_factor: int = 8
+    # The compact index holds every partition; restrict results to these tenants
+    tenants: Optional[List[str]] = None
+
+    def search_by_vector(self, query_vector, k: int) -> List[LangchainDocument]:
+        if not self.tenants:
+            return self.index.documents(self.index.search(query_vector, k, self.rerank_factor))
+        rows = self.index.search(query_vector, k * TENANT_OVERFETCH, self.rerank_factor)
+        documents = [doc for doc in self.index.documents(rows) if doc.metadata.get("tenant") in self.tenants]
+        return documents[:k]
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[LangchainDocument]:
+        return self.search_by_vector(self.embeddings.embed_query(query), self.k)
+
+
+def quantized_directory(index_directory: str) -> str:
+    return os.path.join(index_directory, QUANTIZED_SUBDIRECTORY)
+
+
+def load_version_index(index_directory: str) -> Optional[QuantizedIndex]:
+    """The compact index of an index version, or None if it is missing or does not match the version"""
+    directory = quantized_directory(index_directory)
+    meta = read_index_meta(directory)
+    if meta is None:
+        print(f"No compact index in {index_directory}, serving it from Chroma")
+        return None
+    source_meta = read_index_meta(index_directory) or {"embedding_backend": "ollama", "embedding_model": "llama3"}
+    for key in ("embedding_backend", "embedding_model", "tenants"):
+        if meta.get(key) != source_meta.get(key, [] if key == "tenants" else None):
+            print(f"Compact index in {directory} does not match its version ({key}), serving it from Chroma")
+            return None
+    return QuantizedIndex(directory)
+
+
+def load_quantized_retriever(index_directory: str = None, k: int = 5) -> Optional[QuantizedRetriever]:
+    index_directory = index_directory or current_index_directory()
+    index = load_version_index(index_directory)
+    if index is None:
+        return None
+    return QuantizedRetriever(index=index, embeddings=embeddings_for_index(index_directory), k=k)
+
+
+def build_from_chroma(source_directory: str = None, target_directory: str = None):
+    """Build the compact index from the vectors already stored in a Chroma index"""
+    source_directory = source_directory or current_index_directory()
+    target_directory = target_directory or quantized_directory(source_directory)
+    # All tenant partitions go into one compact index; chunk metadata keeps the tenant
+    data = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+    for source_db in open_partitions(source_directory, embeddings_for_index(source_directory)).values():
+        partition = source_db.get(include=["embeddings", "documents", "metadatas"])
+        for key in data:
+            data[key].extend(partition[key])
+    if len(data["ids"]) == 0:
+        print("Source index is empty, nothing to quantize")
+        return
+
+    QuantizedIndex.build(data["embeddings"], data["documents"], data["metadatas"], data["ids"], target_directory)
+    meta = read_index_meta(source_directory) or {"embedding_backend": "ollama", "embedding_model": "llama3"}
+    write_index_meta(target_directory, meta["embedding_backend"], meta["embedding_model"],
+                     int(np.asarray(data["embeddings"]).shape[1]), quantization="int8", source=source_directory,
+                     tenants=index_tenants(source_directory))
+    print(f"✅ Quantized index with {len(data['ids'])} chunks saved to: {target_directory}")
+
+
+def report(source_directory: str = None, target_directory: str = None, k: int = 5):
+    """Print memory footprint and recall@k of the compact index against Chroma search"""
+    source_directory = source_directory or current_index_directory()
+    target_directory = target_directory or quantized_directory(source_directory)
+    from rag_eval import load_golden_set
+
+    index = QuantizedIndex(target_directory)
+    footprint = index.memory_footprint()
+    print(f"Chunks: {footprint['chunks']}, dimension: {footprint['dimension']}")
+    print(f"int8 scan arrays:   {footprint['scan_bytes'] / 1e6:8.2f} MB")
+    print(f"float16 re-rank:    {footprint['rerank_bytes'] / 1e6:8.2f} MB (memory-mapped, paged on demand)")
+    print(f"float32 baseline:   {footprint['float32_bytes'] / 1e6:8.2f} MB")
+
+    embeddings = embeddings_for_index(source_directory)
+    chroma_retriever = PartitionedRetriever(vector_dbs=open_partitions(source_directory, embeddings), embeddings=embeddings, k=k)
+    overlaps, chroma_ms, quantized_ms = [], [], []
+    for entry in load_golden_set():
+        query_vector = embeddings.embed_query(entry["question"])
+
+        start = time.perf_counter()
+        expected = chroma_retriever.search_by_vector(query_vector, k)
+        chroma_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        found = index.documents(index.search(query_vector, k))
+        quantized_ms.append((time.perf_counter() - start) * 1000)
+
+        expected_texts = {doc.page_content for doc in expected}
+        if expected_texts:
+            overlaps.append(len(expected_texts & {doc.page_content for doc in found}) / len(expected_texts))
+
+    if overlaps:
+        print(f"recall@{k} vs Chroma: {sum(overlaps) / len(overlaps):.3f} over {len(overlaps)} golden questions")
+        print(f"Mean search latency: Chroma {sum(chroma_ms) / len(chroma_ms):.2f} ms, "
+              f"int8 {sum(quantized_ms) / len(quantized_ms):.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or report on the compact int8 company index")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("--source", help="Chroma index to quantize / compare with (defaults to the current version)")
+    parser.add_argument("--target", help="Directory of the compact index (defaults to <source>/int8)")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_from_chroma(args.source, args.target)
+    else:
+        report(args.source, args.target, args.k)
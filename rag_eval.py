@@ -0,0 +1,236 @@
+# rag_eval.py
+"""Retrieval quality and speed evaluation against a golden question set.
+
+Each golden entry maps a question to the company_data file(s) that should
+answer it. For every retriever configuration we report recall@k, MRR and
+query latency so the smallest/fastest configuration that still holds
+quality can be picked. A configuration with a "rerank" scorer over-fetches
+rerank_fetch_k candidates and re-ranks them down to k, as the agents do.
+
+Usage:
+    python rag_eval.py                      # evaluate the default configurations
+    python rag_eval.py --configs my.json    # evaluate configurations from a JSON list
+    python rag_eval.py --output results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Dict, List
+
+from patched_document_processor import DocumentProcessor
+from embeddings import get_embeddings, embeddings_for_index
+from index_store import current_index_directory
+from dedup import document_sources
+from tenants import PartitionedRetriever, open_partitions
+from reranker import Reranker, RerankingRetriever, get_scorer
+
+try:
+    from langchain_chroma import Chroma
+except ImportError:
+    from langchain_community.vectorstores import Chroma
+
+GOLDEN_SET_PATH = "./rag_eval_golden.jsonl"
+DATA_DIRECTORY = "./company_data"
+
+# "persisted" evaluates the index the agents are actually serving from;
+# the other entries are rebuilt in memory from company_data.
+# "persisted-rerank-k3" is the production path: 30 candidates re-ranked down to 3.
+DEFAULT_CONFIGS = [
+    {"name": "persisted-rerank-k3", "persisted": True, "k": 3, "rerank": "cross-encoder"},
+    {"name": "persisted-k5", "persisted": True, "k": 5},
+    {"name": "llama3-1000/200-k5", "k": 5, "chunk_size": 1000, "chunk_overlap": 200, "embedding_model": "llama3"},
+    {"name": "llama3-1000/200-k3", "k": 3, "chunk_size": 1000, "chunk_overlap": 200, "embedding_model": "llama3"},
+    {"name": "llama3-500/100-k5", "k": 5, "chunk_size": 500, "chunk_overlap": 100, "embedding_model": "llama3"},
+    {"name": "llama3-1500/200-k3", "k": 3, "chunk_size": 1500, "chunk_overlap": 200, "embedding_model": "llama3"},
+    {"name": "minilm-1000/200-k5", "k": 5, "chunk_size": 1000, "chunk_overlap": 200,
+     "embedding_backend": "sentence-transformers", "embedding_model": "all-MiniLM-L6-v2"},
+]
+
+
+def load_golden_set(path: str = GOLDEN_SET_PATH) -> List[Dict]:
+    """Load golden questions from a JSONL file of {"question", "sources"} entries"""
+    golden = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                golden.append(json.loads(line))
+    return golden
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class RetrieverEvaluator:
+    def __init__(self, data_directory: str = DATA_DIRECTORY):
+        self.data_directory = data_directory
+        # Parsed chunks per (chunk_size, chunk_overlap), so configurations
+        # sharing a splitter only pay for document processing once
+        self._chunk_cache = {}
+        # Scorers per name, so the cross-encoder model is loaded once
+        self._scorers = {}
+
+    def _load_chunks(self, chunk_size: int, chunk_overlap: int):
+        key = (chunk_size, chunk_overlap)
+        if key not in self._chunk_cache:
+            processor = DocumentProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+            # Exactly what rag_setup.py embeds: PDF pages and spreadsheet
+            # row-groups stay unsplit, as they are in the production index
+            self._chunk_cache[key] = processor.process_directory(self.data_directory)
+        return self._chunk_cache[key]
+
+    def _with_reranker(self, retriever, config: Dict, build_info: Dict):
+        """Wrap a retriever in the re-ranking stage if the configuration asks for one"""
+        if not config.get("rerank"):
+            return retriever
+        name = config["rerank"]
+        if name not in self._scorers:
+            self._scorers[name] = get_scorer(name)
+        reranker = Reranker(
+            self._scorers[name],
+            time_budget_ms=config.get("rerank_budget_ms", float(os.getenv("AIDE_RERANK_BUDGET_MS", "250")))
+        )
+        # The live stats dict: fallbacks counted during evaluation end up in the result
+        build_info["rerank_stats"] = reranker.stats
+        return RerankingRetriever(base_retriever=retriever, reranker=reranker, top_n=config.get("k", 5))
+
+    def build_retriever(self, config: Dict):
+        """Build the retriever described by a configuration dict"""
+        k = config.get("k", 5)
+        # With re-ranking, the ANN stage over-fetches and the re-ranker cuts down to k
+        fetch_k = config.get("rerank_fetch_k", 30) if config.get("rerank") else k
+        build_info = {}
+
+        if config.get("persisted"):
+            persist_directory = config.get("persist_directory") or current_index_directory()
+            embeddings = embeddings_for_index(persist_directory)
+            # Golden questions span companies, so search every tenant partition
+            vector_dbs = open_partitions(persist_directory, embeddings)
+            retriever = PartitionedRetriever(vector_dbs=vector_dbs, embeddings=embeddings, k=fetch_k)
+            return self._with_reranker(retriever, config, build_info), build_info
+
+        embeddings = get_embeddings(config.get("embedding_backend", "ollama"), config.get("embedding_model", "llama3"))
+        chunks = self._load_chunks(config.get("chunk_size", 1000), config.get("chunk_overlap", 200))
+        start = time.perf_counter()
+        # No persist_directory: the evaluation index lives in memory only
+        vector_db = Chroma.from_documents(
+            documents=chunks,
+            embedding=embeddings,
+            collection_name=f"eval_{abs(hash(config['name']))}"
+        )
+        build_info.update({"chunks": len(chunks), "build_seconds": time.perf_counter() - start})
+        retriever = vector_db.as_retriever(search_kwargs={"k": fetch_k})
+        return self._with_reranker(retriever, config, build_info), build_info
+
+    def evaluate_retriever(self, retriever, golden: List[Dict], k: int) -> Dict:
+        """Compute recall@k, MRR and latency of a retriever over the golden set"""
+        recalls, reciprocal_ranks, latencies = [], [], []
+        misses = []
+
+        for entry in golden:
+            expected = set(entry["sources"])
+            start = time.perf_counter()
+            docs = retriever.invoke(entry["question"])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            # A chunk collapsed by dedup.py stands for every file it was found in
+            retrieved = [set(document_sources([doc])) for doc in docs[:k]]
+            found = expected.intersection(set().union(*retrieved))
+            recalls.append(len(found) / len(expected))
+
+            rank = next((i + 1 for i, names in enumerate(retrieved) if names & expected), None)
+            reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+            if not found:
+                misses.append(entry["question"])
+
+        return {
+            "questions": len(golden),
+            f"recall@{k}": statistics.mean(recalls) if recalls else 0.0,
+            "mrr": statistics.mean(reciprocal_ranks) if reciprocal_ranks else 0.0,
+            "latency_ms_mean": statistics.mean(latencies) if latencies else 0.0,
+            "latency_ms_p50": _percentile(latencies, 50),
+            "latency_ms_p95": _percentile(latencies, 95),
+            "misses": misses,
+        }
+
+    def run(self, configs: List[Dict], golden: List[Dict]) -> List[Dict]:
+        """Evaluate every configuration and return one result dict per configuration"""
+        results = []
+        for config in configs:
+            print(f"\nEvaluating configuration: {config['name']}")
+            try:
+                retriever, build_info = self.build_retriever(config)
+                metrics = self.evaluate_retriever(retriever, golden, config.get("k", 5))
+            except Exception as e:
+                print(f"Error evaluating configuration {config['name']}: {e}")
+                continue
+
+            result = {"config": config, **metrics}
+            # Recall keyed by k differs per config; keep a uniform key for comparisons
+            result["recall"] = metrics[f"recall@{config.get('k', 5)}"]
+            if build_info:
+                result.update(build_info)
+            results.append(result)
+        return results
+
+
+def recommend(results: List[Dict], tolerance: float = 0.02):
+    """Pick the fastest configuration whose recall and MRR are within tolerance of the best"""
+    if not results:
+        return None
+    best_recall = max(r["recall"] for r in results)
+    best_mrr = max(r["mrr"] for r in results)
+    candidates = [
+        r for r in results
+        if r["recall"] >= best_recall - tolerance and r["mrr"] >= best_mrr - tolerance
+    ]
+    return min(candidates, key=lambda r: (r["config"].get("k", 5), r["latency_ms_p50"]))
+
+
+def print_report(results: List[Dict]):
+    print("\n" + "=" * 80)
+    print(f"{'Configuration':<28}{'Recall':>9}{'MRR':>9}{'p50 ms':>10}{'p95 ms':>10}{'Chunks':>9}")
+    print("-" * 80)
+    for r in results:
+        print(f"{r['config']['name']:<28}{r['recall']:>9.3f}{r['mrr']:>9.3f}"
+              f"{r['latency_ms_p50']:>10.1f}{r['latency_ms_p95']:>10.1f}{str(r.get('chunks', '-')):>9}")
+    print("=" * 80)
+
+    chosen = recommend(results)
+    if chosen:
+        print(f"✅ Recommended configuration: {chosen['config']['name']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and speed on the golden question set")
+    parser.add_argument("--golden", default=GOLDEN_SET_PATH, help="Golden question JSONL file")
+    parser.add_argument("--data-dir", default=DATA_DIRECTORY, help="Company document directory")
+    parser.add_argument("--configs", help="JSON file with a list of retriever configurations")
+    parser.add_argument("--output", help="Write full results as JSON to this file")
+    args = parser.parse_args()
+
+    golden = load_golden_set(args.golden)
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+
+    evaluator = RetrieverEvaluator(data_directory=args.data_dir)
+    results = evaluator.run(configs, golden)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
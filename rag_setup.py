@@ -1,5 +1,13 @@
 # rag_setup.py
 from patched_document_processor import document_processor
+from dedup import MinHashDeduplicator
+from embeddings import (
+    DEFAULT_BACKEND, DEFAULT_MODELS, get_embeddings, embedding_dimension, resolve_embedding_model, write_index_meta
+)
+from index_store import new_version_directory, publish_version, garbage_collect, discard_version
+from tenants import SHARED_TENANT, collection_name
+from profiling import Profiler
+import argparse
 import os
 
 # Import from the new packages
@@ -8,19 +16,18 @@ try:
 except ImportError:
     from langchain_community.vectorstores import Chroma
 
-try:
-    from langchain_ollama import OllamaEmbeddings
-except ImportError:
-    from langchain_community.embeddings import OllamaEmbeddings
-
-def setup_rag_system():
+def setup_rag_system(embedding_backend=DEFAULT_BACKEND, embedding_model=None, profiler=None):
     # 1. Process all documents
     print("=" * 50)
     print("Starting company document processing...")
     print("=" * 50)
     
     data_directory = "./company_data"  # Company data directory
-    documents = document_processor.process_directory(data_directory)
+    if profiler is not None:
+        documents, profile = profiler.run("ingest", document_processor.process_directory, data_directory)
+        print(f"📈 Ingestion profile written to: {', '.join(profile['files'])}")
+    else:
+        documents = document_processor.process_directory(data_directory)
     
     if not documents:
         print("No processable documents found, please check the company_data directory")
@@ -33,22 +40,68 @@ def setup_rag_system():
     
     # Initialize embeddings with error handling
     try:
-        embeddings = OllamaEmbeddings(model="llama3", base_url="http://localhost:11434")
+        # Same resolution as get_embeddings (AIDE_EMBEDDING_MODEL included), so index_meta.json records the model used
+        embedding_backend, embedding_model = resolve_embedding_model(embedding_backend, embedding_model)
+        embeddings = get_embeddings(embedding_backend, embedding_model)
+        dimension = embedding_dimension(embeddings)
     except Exception as e:
         print(f"Error initializing embeddings: {e}")
-        print("Please ensure Ollama is running on http://localhost:11434")
+        if embedding_backend == "ollama":
+            print("Please ensure Ollama is running on http://localhost:11434")
+        return
+    
+    # Build into a fresh version directory; running agents keep reading the
+    # current version until the pointer is swapped below
+    version, persist_directory = new_version_directory()
+    try:
+        # One collection per tenant, so tenant queries search only their own partition
+        by_tenant = {}
+        for document in documents:
+            by_tenant.setdefault(document.metadata.get("tenant", SHARED_TENANT), []).append(document)
+        for tenant, tenant_documents in sorted(by_tenant.items()):
+            vector_db = Chroma.from_documents(
+                documents=tenant_documents,
+                embedding=embeddings,
+                collection_name=collection_name(tenant),
+                persist_directory=persist_directory
+            )
+            if hasattr(vector_db, "persist"):  # langchain_chroma persists automatically
+                vector_db.persist()
+            print(f"  Partition {tenant}: {len(tenant_documents)} chunks")
+        write_index_meta(persist_directory, embedding_backend, embedding_model, dimension, tenants=sorted(by_tenant))
+    except Exception as e:
+        # A partial build must not linger: it would sort as the newest version
+        discard_version(version)
+        print(f"Error building vector database: {e}")
         return
     
-    vector_db = Chroma.from_documents(
-        documents=documents,
-        embedding=embeddings,
-        persist_directory="./chroma_db_company"
-    )
-    vector_db.persist()
+    if os.getenv("AIDE_RETRIEVER") == "quantized":
+        # The compact index travels with its version; if it fails, agents serve this version from Chroma
+        from quantized_index import build_from_chroma
+        try:
+            build_from_chroma(persist_directory)
+        except Exception as e:
+            print(f"Error building compact int8 index: {e}")
+    publish_version(version)
+    removed = garbage_collect()
     
     print("✅ RAG system setup completed!")
     print(f"📊 Knowledge base contains {len(documents)} document chunks")
-    print(f"💾 Vector database saved to: ./chroma_db_company")
+    print(f"🏢 Tenant partitions: {', '.join(sorted(by_tenant))}")
+    print(f"🧮 Embeddings: {embedding_backend}/{embedding_model} ({dimension} dimensions)")
+    print(f"💾 Vector database saved to: {persist_directory} (version {version})")
+    if removed:
+        print(f"🧹 Removed {len(removed)} old index versions")
 
 if __name__ == "__main__":
-    setup_rag_system()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the company document vector database")
+    parser.add_argument("--embedding-backend", default=DEFAULT_BACKEND, choices=sorted(DEFAULT_MODELS))
+    parser.add_argument("--embedding-model", help="Model name for the chosen backend")
+    parser.add_argument("--dedup-threshold", type=float,
+                        help="Similarity above which near-duplicate chunks are collapsed (0 disables)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile document processing (CPU and memory) into AIDE_PROFILE_DIR")
+    args = parser.parse_args()
+    if args.dedup_threshold is not None:
+        document_processor.deduplicator = MinHashDeduplicator(args.dedup_threshold) if args.dedup_threshold > 0 else None
+    setup_rag_system(args.embedding_backend, args.embedding_model, Profiler() if args.profile else None)
\ No newline at end of file
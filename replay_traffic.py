@@ -0,0 +1,189 @@
+# replay_traffic.py
+"""Replay captured /chat traffic against a gateway and flag regressions.
+
+Reads the rotating capture log written by api_gateway (AIDE_CAPTURE_DIR),
+re-issues every request at its original pace (or --speed times faster, or as
+fast as --concurrency allows with --speed 0), and reports latency
+percentiles. Each response is compared with the captured route and retrieved
+chunk ids; any difference is flagged as a regression, except retrieval
+differences where re-ranking fell back to ANN order on either side: the time
+budget trips nondeterministically under load (e.g. with --speed), so those are
+reported separately.
+
+For LLM-free runs, start the gateway with AIDE_STUB_LLM=1 and pass --stub:
+captured routes are then forced via X-AIDE-Route (the stub cannot route),
+so only retrieval is compared.
+
+Usage:
+    python replay_traffic.py ./captures --gateway http://localhost:8000 --speed 4
+"""
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from traffic_capture import CAPTURE_FILE_NAME
+
+
+def load_captures(directory: str) -> List[Dict]:
+    """Captured entries in time order, across rotated files"""
+    base = os.path.join(directory, CAPTURE_FILE_NAME)
+    entries = []
+    for path in glob.glob(base + "*"):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    return sorted(entries, key=lambda entry: entry["ts"])
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def send_request(gateway: str, entry: Dict, force_route: bool, timeout: float) -> Dict:
+    headers = {"Content-Type": "application/json", "X-AIDE-Trace": "1"}
+    if force_route and entry.get("route"):
+        headers["X-AIDE-Route"] = entry["route"]
+    request = urllib.request.Request(
+        f"{gateway}/chat",
+        data=json.dumps(entry["request"]).encode("utf-8"),
+        headers=headers
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = json.loads(response.read().decode("utf-8"))
+        error = None
+    except Exception as e:
+        body, error = {}, str(e)
+    return {"latency_ms": (time.perf_counter() - start) * 1000, "body": body, "error": error}
+
+
+def compare(entry: Dict, result: Dict, check_route: bool) -> Tuple[List[str], List[str]]:
+    """Describe how a replayed response differs from its capture
+
+    Returns (regressions, retrieval differences explained by a re-rank fallback).
+    """
+    trace = result["body"].get("trace", {})
+    problems, retrieval = [], []
+    if check_route and trace.get("route") != entry.get("route"):
+        problems.append(f"route {entry.get('route')} -> {trace.get('route')}")
+    if trace.get("chunk_ids", []) != entry.get("chunk_ids", []):
+        expected, found = set(entry.get("chunk_ids", [])), set(trace.get("chunk_ids", []))
+        if expected == found:
+            retrieval.append("retrieval order changed")
+        else:
+            retrieval.append(f"retrieval changed ({len(expected - found)} chunks missing, {len(found - expected)} new)")
+    if entry.get("rerank_fallback") or trace.get("rerank_fallback"):
+        return problems, retrieval
+    return problems + retrieval, []
+
+
+def replay(entries: List[Dict], gateway: str, speed: float = 1.0, concurrency: int = 8,
+           stub: bool = False, timeout: float = 300.0) -> Dict:
+    results = [None] * len(entries)
+    lock = threading.Lock()
+
+    def run(index, entry):
+        result = send_request(gateway, entry, force_route=stub, timeout=timeout)
+        with lock:
+            results[index] = result
+
+    replay_start = time.monotonic()
+    first_ts = entries[0]["ts"] if entries else 0.0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, entry in enumerate(entries):
+            if speed > 0:
+                # Keep the captured inter-arrival gaps, compressed by the speed factor
+                delay = (entry["ts"] - first_ts) / speed - (time.monotonic() - replay_start)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(run, index, entry)
+
+    latencies, errors, regressions, fallbacks = [], [], [], []
+    for entry, result in zip(entries, results):
+        if result["error"]:
+            errors.append({"message": entry["request"].get("message"), "error": result["error"]})
+            continue
+        latencies.append(result["latency_ms"])
+        problems, fallback_differences = compare(entry, result, check_route=not stub)
+        if problems:
+            regressions.append({"message": entry["request"].get("message"), "problems": problems})
+        if fallback_differences:
+            fallbacks.append({
+                "message": entry["request"].get("message"),
+                "problems": fallback_differences,
+                "captured_fallback": entry.get("rerank_fallback", False),
+                "replayed_fallback": result["body"].get("trace", {}).get("rerank_fallback", False),
+            })
+
+    captured = [entry["timings_ms"].get("total", 0.0) for entry in entries]
+    return {
+        "requests": len(entries),
+        "errors": errors,
+        "regressions": regressions,
+        "rerank_fallbacks": fallbacks,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p90": _percentile(latencies, 90),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": max(latencies) if latencies else 0.0,
+        },
+        "captured_latency_ms": {
+            "p50": _percentile(captured, 50),
+            "p95": _percentile(captured, 95),
+        },
+    }
+
+
+def print_report(report: Dict):
+    latency, captured = report["latency_ms"], report["captured_latency_ms"]
+    print("=" * 60)
+    print(f"Replayed {report['requests']} requests, {len(report['errors'])} errors")
+    print(f"Latency ms  p50 {latency['p50']:.0f}  p90 {latency['p90']:.0f}  "
+          f"p95 {latency['p95']:.0f}  p99 {latency['p99']:.0f}  max {latency['max']:.0f}")
+    print(f"Captured    p50 {captured['p50']:.0f}  p95 {captured['p95']:.0f}")
+    print("=" * 60)
+    if report["regressions"]:
+        print(f"⚠️ {len(report['regressions'])} route/retrieval regressions:")
+        for regression in report["regressions"][:20]:
+            print(f"  • {regression['message'][:60]!r}: {'; '.join(regression['problems'])}")
+    else:
+        print("✅ No route or retrieval regressions")
+    if report["rerank_fallbacks"]:
+        print(f"ℹ️ {len(report['rerank_fallbacks'])} retrieval differences where re-ranking fell back "
+              f"to ANN order (time budget or scorer error), not counted as regressions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured /chat traffic against a gateway")
+    parser.add_argument("capture_dir", help="Directory containing capture.jsonl*")
+    parser.add_argument("--gateway", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pace multiplier; 0 sends as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stub", action="store_true", help="Gateway runs with AIDE_STUB_LLM=1; force captured routes")
+    parser.add_argument("--limit", type=int, help="Replay only the first N captured requests")
+    parser.add_argument("--output", help="Write the full report as JSON to this file")
+    args = parser.parse_args()
+
+    entries = [entry for entry in load_captures(args.capture_dir) if entry.get("status", 200) == 200]
+    if args.limit:
+        entries = entries[:args.limit]
+    report = replay(entries, args.gateway, args.speed, args.concurrency, args.stub)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,177 @@
+# reranker.py
+"""Re-ranking stage for onboarding retrieval.
+
+The vector search over-fetches candidates cheaply; a local CPU cross-encoder
+(or a lexical scorer when sentence-transformers is unavailable) re-scores the
+(query, chunk) pairs in batches and keeps only the best few, so the llama3
+prompt stays small. Scores are cached, and a hard per-request time budget
+falls back to the original ANN order when scoring runs late or fails: scoring
+runs in a worker thread, and the request stops waiting for it at the deadline.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, List, Tuple
+
+try:
+    from langchain_core.retrievers import BaseRetriever
+except ImportError:
+    from langchain.schema import BaseRetriever
+
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Sent through the retriever's callbacks (on_text) when re-ranking falls back to ANN order
+FALLBACK_EVENT = "rerank:fallback"
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "is", "are", "do", "does",
+    "i", "my", "me", "we", "our", "you", "your", "what", "how", "when", "where", "who", "which",
+    "can", "should", "about", "with", "at", "be", "it", "this", "that", "there",
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_PATTERN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class LexicalScorer:
+    """BM25-style term saturation score; each pair is scored independently so scores can be cached"""
+    name = "lexical"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, average_length: float = 150.0):
+        self.k1 = k1
+        self.b = b
+        self.average_length = average_length
+
+    def score(self, pairs) -> List[float]:
+        scores = []
+        for query, text in pairs:
+            terms = set(_tokenize(query))
+            tokens = _tokenize(text)
+            counts = {}
+            for token in tokens:
+                if token in terms:
+                    counts[token] = counts.get(token, 0) + 1
+            norm = self.k1 * (1 - self.b + self.b * len(tokens) / self.average_length)
+            scores.append(sum(tf * (self.k1 + 1) / (tf + norm) for tf in counts.values()) / math.sqrt(len(terms) or 1))
+        return scores
+
+
+class CrossEncoderScorer:
+    """Local CPU cross-encoder from sentence-transformers"""
+    name = "cross-encoder"
+
+    def __init__(self, model: str = CROSS_ENCODER_MODEL):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model, device="cpu")
+
+    def score(self, pairs) -> List[float]:
+        return [float(s) for s in self.model.predict(list(pairs), batch_size=len(pairs), show_progress_bar=False)]
+
+
+def get_scorer(name: str = "cross-encoder"):
+    """Create a scorer by name, falling back to the lexical scorer if the cross-encoder cannot load"""
+    if name == "cross-encoder":
+        try:
+            return CrossEncoderScorer()
+        except Exception as e:
+            print(f"Cross-encoder unavailable, using lexical re-ranking: {e}")
+    return LexicalScorer()
+
+
+class Reranker:
+    def __init__(self, scorer, batch_size: int = 8, time_budget_ms: float = 250, cache_size: int = 4096,
+                 max_workers: int = 2):
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.time_budget_ms = time_budget_ms
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank")
+        self.stats = {"requests": 0, "fallbacks": 0, "cache_hits": 0, "pairs_scored": 0}
+
+    def _cache_key(self, query: str, text: str):
+        return (query, hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+    def _cached(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+
+    def _store(self, key, score: float):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _score_pending(self, query: str, documents: List, keys: List, scores: List, pending: List,
+                       abandoned: threading.Event):
+        """Score uncached pairs batch by batch, filling `scores` and the cache"""
+        for start in range(0, len(pending), self.batch_size):
+            # The request gave up on this work; finish the running batch only
+            if abandoned.is_set():
+                return
+            batch = pending[start:start + self.batch_size]
+            batch_scores = self.scorer.score([(query, documents[i].page_content) for i in batch])
+            self.stats["pairs_scored"] += len(batch)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
+                self._store(keys[i], score)
+
+    def rerank(self, query: str, documents: List, top_n: int = 3) -> List:
+        """Return the top_n documents by relevance score, or ANN order if the time budget runs out or scoring fails"""
+        return self.rerank_with_status(query, documents, top_n)[0]
+
+    def rerank_with_status(self, query: str, documents: List, top_n: int = 3) -> Tuple[List, bool]:
+        """Like rerank, also returning whether it fell back to ANN order"""
+        deadline = time.perf_counter() + self.time_budget_ms / 1000.0
+        self.stats["requests"] += 1
+
+        keys = [self._cache_key(query, doc.page_content) for doc in documents]
+        scores = [self._cached(key) for key in keys]
+        self.stats["cache_hits"] += sum(1 for s in scores if s is not None)
+        pending = [i for i, s in enumerate(scores) if s is None]
+
+        if pending:
+            abandoned = threading.Event()
+            future = self._pool.submit(self._score_pending, query, documents, keys, scores, pending, abandoned)
+            try:
+                # A batch cannot be interrupted, so the request stops waiting for it instead
+                future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            except FutureTimeoutError:
+                # Batches finished in the background still warm the cache for the next request
+                abandoned.set()
+                self.stats["fallbacks"] += 1
+                return documents[:top_n], True
+            except Exception as e:
+                # A failing scorer (out of memory, tokenizer error) must not fail the answer
+                print(f"Re-ranking error, keeping ANN order: {e}")
+                self.stats["fallbacks"] += 1
+                return documents[:top_n], True
+
+        # Stable sort keeps ANN order between equal scores
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+        return [documents[i] for i in order[:top_n]], False
+
+
+class RerankingRetriever(BaseRetriever):
+    """Over-fetch from a base retriever and re-rank the candidates down to top_n"""
+    base_retriever: Any
+    reranker: Any
+    top_n: int = 3
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List:
+        candidates = self.base_retriever.invoke(query)
+        documents, fell_back = self.reranker.rerank_with_status(query, candidates, self.top_n)
+        if fell_back and run_manager is not None:
+            # Lets traces tell budget fallbacks, which vary with load, from retrieval changes
+            run_manager.on_text(FALLBACK_EVENT)
+        return documents
@@ -0,0 +1,149 @@
+# single_flight.py
+"""Single-flight coalescing of identical in-flight computations.
+
+Concurrent callers with the same key share one computation: the first caller
+(the leader) runs it, later callers join and receive the same result, or the
+same stream of chunks, fanned out as it is produced. Nothing is cached once a
+flight finishes. Joins are time-bounded: a waiter that has not been served
+within join_timeout gives up on the shared flight and computes on its own.
+"""
+import re
+import threading
+import time
+from typing import Callable, Hashable, Iterable, Iterator, Optional
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return _WHITESPACE.sub(" ", query).strip().lower().rstrip("?!.。？！ ")
+
+
+class Flight:
+    """One in-progress computation and everything it has produced so far"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.waiters = 0
+        self._condition = threading.Condition()
+
+    def publish(self, chunk):
+        with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    def finish(self, result=None, error: Optional[BaseException] = None):
+        with self._condition:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._condition.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the flight finishes; False if the timeout ran out first"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.done, timeout)
+
+    def stream(self, timeout: Optional[float] = None) -> Iterator:
+        """Yield every chunk from the start, then follow new chunks until the flight finishes"""
+        index = 0
+        while True:
+            with self._condition:
+                ready = self._condition.wait_for(lambda: index < len(self.chunks) or self.done, timeout)
+                if not ready:
+                    raise TimeoutError("Timed out waiting for the shared computation")
+                pending = self.chunks[index:]
+                finished = self.done
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished and index >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    def __init__(self, join_timeout: Optional[float] = 30.0):
+        self.join_timeout = join_timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "joined": 0, "join_timeouts": 0}
+
+    def _acquire(self, key: Hashable):
+        """Return (flight, is_leader), registering a new flight if none is in progress"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.stats["joined"] += 1
+                return flight, False
+            flight = Flight()
+            self._flights[key] = flight
+            self.stats["leaders"] += 1
+            return flight, True
+
+    def _release(self, key: Hashable, flight: Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def do(self, key: Hashable, fn: Callable):
+        """Run fn once per key among concurrent callers and return its result to all of them"""
+        flight, leader = self._acquire(key)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as e:
+                flight.finish(error=e)
+                raise
+            else:
+                flight.finish(result=result)
+                return result
+            finally:
+                self._release(key, flight)
+
+        if not flight.wait(self.join_timeout):
+            self.stats["join_timeouts"] += 1
+            return fn()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def do_stream(self, key: Hashable, fn: Callable[[], Iterable]) -> Iterator:
+        """Like do(), for a generator: every caller receives the full chunk sequence as it is produced"""
+        flight, leader = self._acquire(key)
+        if leader:
+            def produce():
+                try:
+                    for chunk in fn():
+                        flight.publish(chunk)
+                except BaseException as e:
+                    flight.finish(error=e)
+                else:
+                    flight.finish()
+                finally:
+                    self._release(key, flight)
+
+            # Produce in the background so a slow or disconnected leader never stalls the waiters
+            threading.Thread(target=produce, daemon=True).start()
+            return flight.stream()
+        return self._join_stream(flight, fn)
+
+    def _join_stream(self, flight: Flight, fn: Callable[[], Iterable]) -> Iterator:
+        consumed = 0
+        try:
+            for chunk in flight.stream(self.join_timeout):
+                consumed += 1
+                yield chunk
+        except TimeoutError:
+            self.stats["join_timeouts"] += 1
+            if consumed:
+                raise
+            # Nothing delivered yet, so computing independently cannot duplicate output
+            yield from fn()
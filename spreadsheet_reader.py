@@ -0,0 +1,164 @@
+# spreadsheet_reader.py
+"""Streaming spreadsheet reader producing fixed-size row-group documents.
+
+Each workbook is opened once, in openpyxl's read-only mode, and rows are
+iterated lazily instead of loading whole sheets into DataFrames. Rows are
+emitted in groups of ROWS_PER_GROUP with the header row repeated in every
+group, so each chunk is self-describing and memory stays flat for large
+HR exports. Reading rows and grouping them are separate steps, so the
+document processor caches rendered rows and groups them at chunking time.
+"""
+import csv
+import os
+from itertools import groupby
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain.docstore.document import Document as LangchainDocument
+
+ROWS_PER_GROUP = 50
+
+
+def _format_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _format_row(values: Iterable) -> List[str]:
+    return [_format_cell(v) for v in values]
+
+
+def _iter_xlsx_sheets(file_path: str) -> Iterator:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            # Read-only mode trusts the sheet's <dimension> element, which some
+            # exporters write wrongly (e.g. A1:A1); re-scan so no rows are lost
+            worksheet.reset_dimensions()
+            yield worksheet.title, worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_xls_sheets(file_path: str) -> Iterator:
+    # Legacy .xls has no streaming reader; open the workbook once and parse sheet by sheet
+    import pandas as pd
+
+    with pd.ExcelFile(file_path) as excel_file:
+        for sheet_name in excel_file.sheet_names:
+            df = excel_file.parse(sheet_name, header=None)
+            yield sheet_name, df.itertuples(index=False, name=None)
+
+
+def iter_workbook_sheets(file_path: str) -> Iterator:
+    """Yield (sheet name, row iterator) for every sheet, opening the workbook once"""
+    if os.path.splitext(file_path)[1].lower() == '.xls':
+        return _iter_xls_sheets(file_path)
+    return _iter_xlsx_sheets(file_path)
+
+
+def iter_row_lines(rows: Iterable) -> Iterator[Tuple[int, str]]:
+    """Yield (row number, rendered row) for every non-empty row"""
+    for row_number, values in enumerate(rows, start=1):
+        row = _format_row(values)
+        if any(row):
+            yield row_number, " | ".join(row)
+
+
+def iter_row_groups(row_lines: Iterable[Tuple[int, str]], group_size: int = ROWS_PER_GROUP) -> Iterator:
+    """Yield (header, first row number, last row number, rows) groups of rendered rows; the first row is the header
+
+    A sheet with a single non-empty row has no header: that row is yielded as data.
+    """
+    header: Optional[str] = None
+    header_row_number = None
+    emitted = False
+    group, group_start, group_end = [], None, None
+
+    for row_number, line in row_lines:
+        if header is None:
+            header, header_row_number = line, row_number
+            continue
+        if group_start is None:
+            group_start = row_number
+        group.append(line)
+        group_end = row_number
+        if len(group) >= group_size:
+            yield header, group_start, group_end, group
+            emitted = True
+            group, group_start = [], None
+
+    if group:
+        yield header, group_start, group_end, group
+    elif header is not None and not emitted:
+        yield "", header_row_number, header_row_number, [header]
+
+
+def _render_group(title: str, header: str, group_start: int, group_end: int, rows: List[str]) -> str:
+    lines = [f"{title} (rows {group_start}-{group_end})", ""]
+    if header:
+        lines.append(header)
+    lines.extend(rows)
+    return "\n".join(lines)
+
+
+def iter_excel_rows(file_path: str) -> Iterator[Tuple[str, int, str]]:
+    """Yield (sheet name, row number, rendered row) for every non-empty row of a workbook"""
+    for sheet_name, rows in iter_workbook_sheets(file_path):
+        for row_number, line in iter_row_lines(rows):
+            yield sheet_name, row_number, line
+
+
+def iter_csv_rows(file_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (row number, rendered row) for every non-empty row of a CSV file"""
+    with open(file_path, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+        yield from iter_row_lines(csv.reader(f))
+
+
+def excel_row_group_documents(file_path: str, sheet_rows: Iterable[Tuple[str, int, str]],
+                              group_size: int = ROWS_PER_GROUP) -> Iterator[LangchainDocument]:
+    """Group (sheet name, row number, rendered row) rows into row-group documents, sheet by sheet"""
+    for sheet_name, numbered_rows in groupby(sheet_rows, key=lambda row: row[0]):
+        row_lines = ((row_number, line) for _, row_number, line in numbered_rows)
+        for header, group_start, group_end, group in iter_row_groups(row_lines, group_size):
+            yield LangchainDocument(
+                page_content=_render_group(f"Worksheet: {sheet_name}", header, group_start, group_end, group),
+                metadata={
+                    "source": file_path,
+                    "type": "excel",
+                    "sheet": sheet_name,
+                    "filename": os.path.basename(file_path),
+                    "row_start": group_start,
+                    "row_end": group_end
+                }
+            )
+
+
+def csv_row_group_documents(file_path: str, row_lines: Iterable[Tuple[int, str]],
+                            group_size: int = ROWS_PER_GROUP) -> Iterator[LangchainDocument]:
+    """Group (row number, rendered row) rows of a CSV file into row-group documents"""
+    for header, group_start, group_end, group in iter_row_groups(row_lines, group_size):
+        yield LangchainDocument(
+            page_content=_render_group(f"CSV File: {os.path.basename(file_path)}", header, group_start, group_end, group),
+            metadata={
+                "source": file_path,
+                "type": "csv",
+                "filename": os.path.basename(file_path),
+                "row_start": group_start,
+                "row_end": group_end
+            }
+        )
+
+
+def read_excel_documents(file_path: str, group_size: int = ROWS_PER_GROUP) -> Iterator[LangchainDocument]:
+    """Stream row-group documents from every sheet of an Excel workbook"""
+    return excel_row_group_documents(file_path, iter_excel_rows(file_path), group_size)
+
+
+def read_csv_documents(file_path: str, group_size: int = ROWS_PER_GROUP) -> Iterator[LangchainDocument]:
+    """Stream row-group documents from a CSV file"""
+    return csv_row_group_documents(file_path, iter_csv_rows(file_path), group_size)
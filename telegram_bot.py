@@ -1,4 +1,5 @@
 # telegram_bot.py
+import asyncio
 import logging
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
@@ -90,7 +91,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     # Process the query through our agent system
     try:
-        response_data = agents_system.process_query(user_query, user_profiles[user_id])
+        # Run in a worker thread so the event loop keeps serving other updates (this
+        # handler is non-blocking, see main); identical group-chat questions that
+        # overlap are coalesced by the agents' single-flight layer
+        response_data = await asyncio.to_thread(agents_system.process_query, user_query, user_profiles[user_id])
         
         # Build response message
         reply_message = f"{response_data['agent_name']}:\n\n{response_data['answer']}"
@@ -156,7 +160,10 @@ def main() -> None:
             SETTING_ROLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_role)],
             SETTING_INTERESTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_interests)],
             CHATTING: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message),
+                # ConversationHandler needs updates processed one at a time, so only the
+                # slow LLM handler runs non-blocking: other chats no longer wait behind it,
+                # while role and interests are still handled strictly in order
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message, block=False),
                 CommandHandler("onboarding", quick_onboarding),
                 CommandHandler("learning", quick_learning),
                 CommandHandler("career", quick_career),
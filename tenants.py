@@ -0,0 +1,118 @@
+# tenants.py
+"""Per-tenant (company) partitions of the company index.
+
+Ingestion assigns every file to a tenant and writes one Chroma collection per
+tenant (company_<tenant>) into the index version directory. The tenant of a
+file comes from company_data/manifest.json:
+
+    {"default": "shared",
+     "tenants": {"nvidia": ["*nvidia*"], "google": ["*google*"]}}
+
+(patterns are matched case-insensitively against the path relative to the data
+directory), otherwise from its first sub-directory (company_data/<tenant>/...),
+otherwise the manifest default ("shared"). A tenant's queries search its own
+partition plus the shared one; queries without a known tenant search all
+partitions. Indexes built before partitioning are served as one "shared"
+partition.
+"""
+import fnmatch
+import json
+import os
+import re
+from typing import Any, Dict, List
+
+from embeddings import read_index_meta
+
+try:
+    from langchain_core.retrievers import BaseRetriever
+except ImportError:
+    from langchain.schema import BaseRetriever
+
+try:
+    from langchain_chroma import Chroma
+except ImportError:
+    from langchain_community.vectorstores import Chroma
+
+MANIFEST_FILE = "manifest.json"
+SHARED_TENANT = "shared"
+ALL_TENANTS = ""
+
+
+def normalize_tenant(tenant: str) -> str:
+    """Lower-case tenant name restricted to characters valid in a collection name"""
+    return re.sub(r"[^a-z0-9_-]", "_", (tenant or "").strip().lower())
+
+
+def collection_name(tenant: str) -> str:
+    return f"company_{tenant}"
+
+
+def load_manifest(data_directory: str) -> Dict:
+    path = os.path.join(data_directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading tenant manifest {path}: {e}")
+        return {}
+
+
+def tenant_for_file(file_path: str, data_directory: str, manifest: Dict) -> str:
+    relative = os.path.relpath(file_path, data_directory).replace(os.sep, "/")
+    for tenant, patterns in manifest.get("tenants", {}).items():
+        if any(fnmatch.fnmatch(relative.lower(), pattern.lower()) for pattern in patterns):
+            return normalize_tenant(tenant)
+    parts = relative.split("/")
+    if len(parts) > 1:
+        return normalize_tenant(parts[0])
+    return normalize_tenant(manifest.get("default", SHARED_TENANT))
+
+
+def index_tenants(persist_directory: str) -> List[str]:
+    """Tenants partitioned in an index version; empty for unpartitioned indexes"""
+    return (read_index_meta(persist_directory) or {}).get("tenants", [])
+
+
+def open_partitions(persist_directory: str, embeddings) -> Dict[str, Any]:
+    """One Chroma store per tenant partition of an index version"""
+    tenants = index_tenants(persist_directory)
+    if not tenants:
+        # Unpartitioned index: its default collection holds every tenant
+        return {SHARED_TENANT: Chroma(persist_directory=persist_directory, embedding_function=embeddings)}
+    return {
+        tenant: Chroma(
+            collection_name=collection_name(tenant),
+            persist_directory=persist_directory,
+            embedding_function=embeddings
+        )
+        for tenant in tenants
+    }
+
+
+def tenant_search_scopes(tenants: List[str]) -> Dict[str, List[str]]:
+    """Partitions searched for each tenant key; ALL_TENANTS searches everything"""
+    scopes = {ALL_TENANTS: list(tenants)}
+    for tenant in tenants:
+        if tenant != SHARED_TENANT:
+            scopes[tenant] = [name for name in tenants if name in (tenant, SHARED_TENANT)]
+    return scopes
+
+
+class PartitionedRetriever(BaseRetriever):
+    """Search several tenant partitions with one query embedding and merge by distance"""
+    vector_dbs: Dict[str, Any]
+    embeddings: Any
+    k: int = 5
+
+    def search_by_vector(self, query_vector, k: int) -> List:
+        scored = []
+        for vector_db in self.vector_dbs.values():
+            scored.extend(vector_db.similarity_search_by_vector_with_relevance_scores(query_vector, k=k))
+        # Every partition uses the same embeddings and distance, so distances are comparable
+        scored.sort(key=lambda pair: pair[1])
+        return [doc for doc, _ in scored[:k]]
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List:
+        return self.search_by_vector(self.embeddings.embed_query(query), self.k)
@@ -0,0 +1,275 @@
+# text_reader.py
+"""Single-pass reader for plain text, Markdown and HTML files.
+
+The encoding is guessed from a sample at the head of the file instead of
+re-reading the whole file per candidate encoding. The file is then decoded
+strictly, block by block (memory-mapped above MMAP_THRESHOLD_BYTES); a byte
+the sample did not reveal as undecodable restarts the read with the next
+candidate encoding, so text is never silently replaced. Markup and
+boilerplate are stripped incrementally (html.parser for HTML, line rules for
+Markdown), so the raw file is never held in memory whole. The cleaned
+sections are streamed into the artifact store, read back lazily, and
+split_text_stream splits them window by window instead of joining them into
+one string, so no stage holds much more than a section or a window.
+"""
+import codecs
+import mmap
+import os
+import re
+from html.parser import HTMLParser
+from typing import Callable, Iterable, Iterator, List
+
+SAMPLE_BYTES = 64 * 1024
+BLOCK_BYTES = 1024 * 1024
+MMAP_THRESHOLD_BYTES = 8 * 1024 * 1024
+SECTION_CHARS = 256 * 1024
+CANDIDATE_ENCODINGS = ['utf-8', 'gbk', 'gb2312', 'latin-1']
+
+# Longest BOM first: the UTF-32 LE BOM starts with the UTF-16 LE one
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+HTML_EXTENSIONS = {'.html', '.htm'}
+MARKDOWN_EXTENSIONS = {'.md', '.markdown'}
+
+
+def candidate_encodings(file_path: str, sample_bytes: int = SAMPLE_BYTES) -> List[str]:
+    """Encodings to try in order: a BOM match, else the candidates from the first that decodes the sample"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return [encoding] + CANDIDATE_ENCODINGS
+    for index, encoding in enumerate(CANDIDATE_ENCODINGS):
+        try:
+            # final=False: a multi-byte character cut at the sample end is not an error
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return CANDIDATE_ENCODINGS[index:]
+        except UnicodeDecodeError:
+            continue
+    return ['latin-1']
+
+
+def detect_encoding(file_path: str, sample_bytes: int = SAMPLE_BYTES) -> str:
+    return candidate_encodings(file_path, sample_bytes)[0]
+
+
+def text_kind(file_path: str) -> str:
+    """Cleaner applied to a file: "html", "markdown" or "text" """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in HTML_EXTENSIONS:
+        return "html"
+    if extension in MARKDOWN_EXTENSIONS:
+        return "markdown"
+    return "text"
+
+
+def _iter_byte_blocks(file_path: str, block_bytes: int) -> Iterator[bytes]:
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        if size >= MMAP_THRESHOLD_BYTES:
+            # Pages are mapped on demand and dropped by the OS, the file is never copied whole
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, size, block_bytes):
+                    yield mapped[start:start + block_bytes]
+        else:
+            while True:
+                block = f.read(block_bytes)
+                if not block:
+                    break
+                yield block
+
+
+def iter_decoded_blocks(file_path: str, encoding: str, block_bytes: int = BLOCK_BYTES) -> Iterator[str]:
+    """Decode a file block by block with newlines normalized to \\n; raises UnicodeDecodeError"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending_cr = ""
+    for block in _iter_byte_blocks(file_path, block_bytes):
+        text = pending_cr + decoder.decode(block)
+        # Hold back a trailing \r in case the matching \n starts the next block
+        pending_cr = "\r" if text.endswith("\r") else ""
+        if pending_cr:
+            text = text[:-1]
+        yield text.replace("\r\n", "\n").replace("\r", "\n")
+    yield (pending_cr + decoder.decode(b"", final=True)).replace("\r\n", "\n").replace("\r", "\n")
+
+
+class HTMLTextExtractor(HTMLParser):
+    """Visible text of an HTML document, without scripts, styles and page chrome"""
+    SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'nav', 'header', 'footer', 'aside', 'form'}
+    BLOCK_TAGS = {
+        'p', 'div', 'br', 'li', 'tr', 'ul', 'ol', 'table', 'section', 'article', 'main', 'title',
+        'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote', 'dt', 'dd', 'hr'
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._skip_depth = 0
+        self._parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self._parts.append("\n")
+        elif tag in ('td', 'th'):
+            self._parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(data)
+
+    def drain(self) -> str:
+        """Text extracted since the last drain"""
+        text, self._parts = "".join(self._parts), []
+        return text
+
+
+class MarkdownStripper:
+    """Line-based removal of Markdown syntax, front matter, comments and inline HTML"""
+    _LINE_RULES = [
+        (re.compile(r"^\s{0,3}(```|~~~).*$"), ""),                           # code fence markers
+        (re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$"), ""),                 # horizontal rules
+        (re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$"), ""),  # table separators
+        (re.compile(r"^\s{0,3}\[[^\]]+\]:\s*\S+.*$"), ""),                   # link reference definitions
+        (re.compile(r"^\s{0,3}#{1,6}\s*"), ""),                              # heading markers
+        (re.compile(r"^(\s{0,3}>\s?)+"), ""),                                # block quotes
+    ]
+    _INLINE_RULES = [
+        (re.compile(r"<!--.*?-->"), ""),
+        (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),                      # images -> alt text
+        (re.compile(r"\[([^\]]+)\]\([^)]*\)"), r"\1"),                       # links -> link text
+        (re.compile(r"\[([^\]]+)\]\[[^\]]*\]"), r"\1"),                      # reference links
+        (re.compile(r"</?[a-zA-Z][^>]*>"), ""),                              # inline HTML tags
+        (re.compile(r"(\*\*|__)(.+?)\1"), r"\2"),                            # bold
+        (re.compile(r"(?<!\w)[*_](\S[^*_\n]*?)[*_](?!\w)"), r"\1"),          # italics
+        (re.compile(r"`([^`]+)`"), r"\1"),                                   # inline code
+    ]
+
+    def __init__(self):
+        self._partial_line = ""
+        self._line_number = 0
+        self._in_front_matter = False
+        self._in_comment = False
+
+    def _strip_line(self, line: str) -> str:
+        self._line_number += 1
+        if self._line_number == 1 and line.strip() == "---":
+            self._in_front_matter = True
+            return None
+        if self._in_front_matter:
+            if line.strip() in ("---", "..."):
+                self._in_front_matter = False
+            return None
+        if self._in_comment:
+            if "-->" not in line:
+                return None
+            self._in_comment = False
+            line = line.split("-->", 1)[1]
+        if "<!--" in line and "-->" not in line.split("<!--", 1)[1]:
+            self._in_comment = True
+            line = line.split("<!--", 1)[0]
+
+        for pattern, replacement in self._LINE_RULES:
+            line = pattern.sub(replacement, line)
+        for pattern, replacement in self._INLINE_RULES:
+            line = pattern.sub(replacement, line)
+        return line
+
+    def feed(self, text: str) -> str:
+        lines = (self._partial_line + text).split("\n")
+        self._partial_line = lines.pop()
+        stripped = (self._strip_line(line) for line in lines)
+        return "".join(line + "\n" for line in stripped if line is not None)
+
+    def close(self) -> str:
+        line, self._partial_line = self._partial_line, ""
+        stripped = self._strip_line(line) if line else None
+        return stripped or ""
+
+
+_SPACE_RUNS = re.compile(r"[ \t\f\v]+")
+_BLANK_LINE_RUNS = re.compile(r"\n[ \t]*(\n[ \t]*)+")
+
+
+def _normalize_whitespace(text: str) -> str:
+    return _BLANK_LINE_RUNS.sub("\n\n", _SPACE_RUNS.sub(" ", text))
+
+
+def iter_clean_text(file_path: str, encoding: str, kind: str = None) -> Iterator[str]:
+    """Cleaned text of a file in blocks of roughly SECTION_CHARS characters"""
+    kind = kind or text_kind(file_path)
+
+    if kind == "html":
+        extractor = HTMLTextExtractor()
+        def clean(text):
+            extractor.feed(text)
+            return _normalize_whitespace(extractor.drain())
+        def finish():
+            extractor.close()
+            return _normalize_whitespace(extractor.drain())
+    elif kind == "markdown":
+        stripper = MarkdownStripper()
+        def clean(text):
+            return _normalize_whitespace(stripper.feed(text))
+        def finish():
+            return _normalize_whitespace(stripper.close())
+    else:
+        clean, finish = (lambda text: text), (lambda: "")
+
+    section = []
+    section_chars = 0
+    for block in iter_decoded_blocks(file_path, encoding):
+        text = clean(block)
+        section.append(text)
+        section_chars += len(text)
+        if section_chars >= SECTION_CHARS:
+            yield "".join(section)
+            section, section_chars = [], 0
+    section.append(finish())
+    text = "".join(section)
+    if text.strip():
+        yield text
+
+
+def with_encoding_fallback(file_path: str, read_fn: Callable[[str], object]):
+    """Return read_fn(encoding), trying the next candidate encoding on the first undecodable byte
+
+    read_fn must consume the whole file before returning, so decoding errors surface here.
+    """
+    for encoding in candidate_encodings(file_path):
+        try:
+            return read_fn(encoding)
+        except UnicodeDecodeError as e:
+            print(f"{file_path} is not {encoding} past the sampled head ({e.reason}), retrying")
+    # Unreachable while latin-1, which decodes any byte, ends the candidate list
+    raise ValueError(f"Cannot decode file: {file_path}")
+
+
+def split_text_stream(splitter, blocks: Iterable[str], window_chars: int = SECTION_CHARS) -> Iterator[str]:
+    """Split a stream of text blocks into chunks, holding at most about one window in memory"""
+    window = ""
+    for block in blocks:
+        window += block
+        if len(window) < window_chars:
+            continue
+        chunks = splitter.split_text(window)
+        if len(chunks) < 2:
+            continue
+        yield from chunks[:-1]
+        # Re-split from the start of the last chunk so it can grow with the next block
+        start = window.rfind(chunks[-1])
+        window = window[start:] if start >= 0 else chunks[-1]
+    if window.strip():
+        yield from splitter.split_text(window)
@@ -0,0 +1,103 @@
+# traffic_capture.py
+"""Opt-in capture of /chat traffic for deterministic replay.
+
+Set AIDE_CAPTURE_DIR to enable. Each request is appended as one JSON line
+with the request, the chosen route, the retrieved chunk ids, whether
+re-ranking fell back to ANN order, and per-stage timings, to a size-rotated log (AIDE_CAPTURE_MAX_BYTES per file,
+AIDE_CAPTURE_BACKUPS rotated files). replay_traffic.py re-issues it.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Dict, Optional
+
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+except ImportError:
+    from langchain.callbacks.base import BaseCallbackHandler
+
+from reranker import FALLBACK_EVENT
+
+CAPTURE_FILE_NAME = "capture.jsonl"
+
+
+def chunk_id(doc) -> str:
+    """Stable chunk identifier derived from content, so it survives re-indexing"""
+    key = f"{doc.metadata.get('filename', '')}\x00{doc.page_content}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+class StageTimingCallback(BaseCallbackHandler):
+    """Record retrieval and generation timings and the retrieved chunks of a chain run"""
+
+    def __init__(self):
+        self.timings_ms = {}
+        self.chunk_ids = []
+        self.rerank_fallback = False
+        self._started = {}
+
+    def _start(self, stage):
+        self._started[stage] = time.perf_counter()
+
+    def _end(self, stage):
+        started = self._started.pop(stage, None)
+        if started is not None:
+            self.timings_ms[stage] = self.timings_ms.get(stage, 0.0) + (time.perf_counter() - started) * 1000
+
+    def on_retriever_start(self, serialized, query, **kwargs):
+        self._start("retrieve")
+
+    def on_retriever_end(self, documents, **kwargs):
+        self._end("retrieve")
+        self.chunk_ids = [chunk_id(doc) for doc in documents]
+
+    def on_text(self, text, **kwargs):
+        if text == FALLBACK_EVENT:
+            self.rerank_fallback = True
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._start("generate")
+
+    def on_llm_end(self, response, **kwargs):
+        self._end("generate")
+
+
+class TrafficCapture:
+    def __init__(self, directory: str, max_bytes: int = 10_000_000, backups: int = 5):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, CAPTURE_FILE_NAME)
+        # A dedicated, non-propagating logger gives thread-safe appends and rotation for free
+        self.logger = logging.getLogger(f"aide.capture.{os.path.abspath(directory)}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+
+    def record(self, request: Dict, trace: Dict, total_ms: float, status: int = 200):
+        entry = {
+            "ts": time.time(),
+            "request": request,
+            "route": trace.get("route"),
+            "chunk_ids": trace.get("chunk_ids", []),
+            "rerank_fallback": trace.get("rerank_fallback", False),
+            "timings_ms": {**trace.get("timings_ms", {}), "total": total_ms},
+            "coalesced": trace.get("coalesced", False),
+            "status": status,
+        }
+        self.logger.info(json.dumps(entry, ensure_ascii=False))
+
+
+def capture_from_env() -> Optional[TrafficCapture]:
+    directory = os.getenv("AIDE_CAPTURE_DIR")
+    if not directory:
+        return None
+    return TrafficCapture(
+        directory,
+        max_bytes=int(os.getenv("AIDE_CAPTURE_MAX_BYTES", "10000000")),
+        backups=int(os.getenv("AIDE_CAPTURE_BACKUPS", "5"))
+    )
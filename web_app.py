@@ -1,7 +1,55 @@
 # web_app.py
 import streamlit as st
-from agents import agents_system
 import json
+import os
+import uuid
+
+# By default the UI is a thin client of api_gateway: LLM clients, the vector
+# index and the re-ranker live in the gateway tier, so UI replicas stay light.
+# AIDE_WEB_MODE=local runs the agents inside the Streamlit process instead.
+WEB_MODE = os.getenv("AIDE_WEB_MODE", "gateway")
+GATEWAY_URL = os.getenv("AIDE_GATEWAY_URL", "http://localhost:8000")
+
+@st.cache_resource
+def get_gateway_client():
+    """One pooled HTTP client per server process, shared by all sessions"""
+    import httpx
+    return httpx.Client(
+        base_url=GATEWAY_URL,
+        timeout=httpx.Timeout(300.0, connect=5.0),
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+    )
+
+@st.cache_resource
+def get_local_agents():
+    """In-process agents, built once per server process (AIDE_WEB_MODE=local)"""
+    from agents import agents_system
+    return agents_system
+
+def stream_answer_events(prompt, user_data):
+    """Yield answer events (meta, sources, token, done) from the gateway or the local agents"""
+    if WEB_MODE == "local":
+        yield from get_local_agents().process_query_stream(prompt, user_data)
+        return
+    
+    payload = {
+        "message": prompt,
+        "user_id": st.session_state.user_id,
+        "role": user_data.get('role', ''),
+        "interests": user_data.get('interests', ''),
+        "tenant": user_data.get('tenant', '')
+    }
+    with get_gateway_client().stream("POST", "/chat/stream", json=payload) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+def format_sources(sources):
+    sources_text = "\n\n📁 **Sources:**\n" + "\n".join([f"• {src}" for src in sources[:3]])
+    if len(sources) > 3:
+        sources_text += f"\n• ... and {len(sources) - 3} more"
+    return sources_text
 
 def main():
     st.set_page_config(
@@ -18,6 +66,8 @@ def main():
         st.session_state.user_data = {}
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = f"web-{uuid.uuid4().hex[:12]}"
     
     # Sidebar for profile setup
     with st.sidebar:
@@ -29,10 +79,13 @@ def main():
             interests = st.text_input("Your Career Interests",
                                     placeholder="e.g., leadership, data science, design",
                                     value=st.session_state.user_data.get('interests', ''))
+            tenant = st.text_input("Your Company",
+                                 placeholder="e.g., nvidia, google, microsoft",
+                                 value=st.session_state.user_data.get('tenant', ''))
             submitted = st.form_submit_button("Save Profile")
             
             if submitted:
-                st.session_state.user_data = {'role': role, 'interests': interests}
+                st.session_state.user_data = {'role': role, 'interests': interests, 'tenant': tenant}
                 st.success("Profile saved!")
     
     # Main chat interface
@@ -55,27 +108,36 @@ def main():
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Get AI response
+        # Get AI response, rendering sources and tokens as they arrive
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    response_data = agents_system.process_query(prompt, st.session_state.user_data)
-                    response_text = f"**{response_data['agent_name']}:**\n\n{response_data['answer']}"
-                    
-                    # Add sources if available
-                    if response_data['sources']:
-                        sources_text = "\n\n📁 **Sources:**\n" + "\n".join([f"• {src}" for src in response_data['sources'][:3]])
-                        if len(response_data['sources']) > 3:
-                            sources_text += f"\n• ... and {len(response_data['sources']) - 3} more"
-                        response_text += sources_text
-                    
-                    st.markdown(response_text)
-                    st.session_state.chat_history.append({"role": "assistant", "content": response_text})
-                    
-                except Exception as e:
-                    error_msg = "Sorry, I encountered an error. Please try again."
-                    st.error(error_msg)
-                    st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
+            header_placeholder = st.empty()
+            answer_placeholder = st.empty()
+            sources_placeholder = st.empty()
+            header_placeholder.markdown("_Thinking..._")
+            
+            agent_name, answer, sources_text = "", "", ""
+            try:
+                for event in stream_answer_events(prompt, st.session_state.user_data):
+                    if event["type"] == "meta":
+                        agent_name = event["agent_name"]
+                        header_placeholder.markdown(f"**{agent_name}:**")
+                    elif event["type"] == "sources" and event["sources"]:
+                        sources_text = format_sources(list(dict.fromkeys(event["sources"])))
+                        sources_placeholder.markdown(sources_text)
+                    elif event["type"] == "token":
+                        answer += event["text"]
+                        answer_placeholder.markdown(answer + "▌")
+                    elif event["type"] == "error":
+                        raise RuntimeError(event["detail"])
+                
+                answer_placeholder.markdown(answer)
+                response_text = f"**{agent_name}:**\n\n{answer}{sources_text}"
+                st.session_state.chat_history.append({"role": "assistant", "content": response_text})
+                
+            except Exception as e:
+                error_msg = "Sorry, I encountered an error. Please try again."
+                st.error(error_msg)
+                st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
     
     # Quick action buttons
     st.write("---")